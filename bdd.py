@@ -0,0 +1,325 @@
+FALSE, TRUE = 0, 1 # the terminals of both diagrams; of a ZDD, the empty family and the family of only the empty set.
+
+
+def evaluate(key, split, memo):
+    # evaluates a key bottom-up without recursion, where split(key) returns the keys of its subproblems
+    # along with the function combining their results into that of the key, and memo holds the results.
+    pending = {}
+    stack = [key]
+    while stack:
+        top = stack[-1]
+        if top in memo:
+            stack.pop()
+        elif top not in pending:
+            pending[top] = split(top)
+            stack.extend(subkey for subkey in pending[top][0] if subkey not in memo)
+        else:
+            subkeys, combine = pending.pop(top)
+            memo[top] = combine(*(memo[subkey] for subkey in subkeys))
+            stack.pop()
+    return memo[key]
+
+
+def result(value):
+    return (), lambda: value
+
+
+class Diagram:
+    # nodes kept unique in a table; the variable of a node is its level.
+
+    def __init__(self, variables):
+        self.variables = list(variables)
+        self.nodes = [(len(self.variables), FALSE, FALSE), (len(self.variables), TRUE, TRUE)] # (level, low, high) by the IDs.
+        self.unique = {}
+        self.cache = {}
+
+    def level(self, node):
+        return self.nodes[node][0]
+
+    def cofactors(self, node, level):
+        node_level, low, high = self.nodes[node]
+        return (low, high) if node_level == level else (node, node)
+
+    def make(self, level, low, high):
+        if (node := self.unique.get((level, low, high))) is None:
+            node = self.unique[level, low, high] = len(self.nodes)
+            self.nodes.append((level, low, high))
+        return node
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class BDD(Diagram):
+    # a reduced ordered BDD with its operations cached.
+
+    def node(self, level, low, high):
+        return low if low == high else self.make(level, low, high)
+
+    def apply(self, op, left, right):
+        def split(key):
+            _, left, right = key
+            if left == right:
+                return result(left)
+            if {left, right} & {FALSE, TRUE}:
+                terminal, other = (left, right) if left in (FALSE, TRUE) else (right, left)
+                return result(terminal if (terminal == TRUE) == (op == 'or') else other)
+            level = min(self.level(left), self.level(right))
+            (left_low, left_high), (right_low, right_high) = self.cofactors(left, level), self.cofactors(right, level)
+            return ((op, *sorted((left_low, right_low))), (op, *sorted((left_high, right_high)))), \
+                lambda low, high: self.node(level, low, high)
+
+        return evaluate((op, *sorted((left, right))), split, self.cache)
+
+    def conjoin(self, *nodes):
+        conjunction = TRUE
+        for node in nodes:
+            conjunction = self.apply('and', conjunction, node)
+        return conjunction
+
+    def disjoin(self, *nodes):
+        disjunction = FALSE
+        for node in nodes:
+            disjunction = self.apply('or', disjunction, node)
+        return disjunction
+
+
+class ZDD(Diagram):
+    # a zero-suppressed diagram holding a family of sets of variables.
+
+    def node(self, level, low, high):
+        return low if high == FALSE else self.make(level, low, high)
+
+    def union(self, left, right):
+        def split(key):
+            _, left, right = key
+            if left == FALSE or left == right:
+                return result(right)
+            if right == FALSE:
+                return result(left)
+            level = min(self.level(left), self.level(right))
+            (left_low, left_high), (right_low, right_high) = self.zero_cofactors(left, level), self.zero_cofactors(right, level)
+            return (('union', *sorted((left_low, right_low))), ('union', *sorted((left_high, right_high)))), \
+                lambda low, high: self.node(level, low, high)
+
+        return evaluate(('union', *sorted((left, right))), split, self.cache)
+
+    def zero_cofactors(self, node, level):
+        # the sets without and with the variable of the level, less it; a node of a lower variable has none with it.
+        node_level, low, high = self.nodes[node]
+        return (low, high) if node_level == level else (node, FALSE)
+
+    def nonsupersets(self, left, right):
+        # the sets of left that include none of the sets of right.
+        def split(key):
+            _, left, right = key
+            if right == FALSE:
+                return result(left)
+            if left == FALSE or right == TRUE or left == right:
+                return result(FALSE)
+            if self.level(left) > self.level(right):
+                # no set of left has the variable of right, so the sets of right with it include none of them.
+                return (('nonsupersets', left, self.nodes[right][1]),), lambda value: value
+            level = self.level(left)
+            (left_low, left_high), (right_low, right_high) = self.zero_cofactors(left, level), self.zero_cofactors(right, level)
+            return (('nonsupersets', left_low, right_low), ('nonsupersets', left_high, right_high)), \
+                lambda low, high: self.node(level, low, self.nonsupersets(high, right_low))
+
+        return evaluate(('nonsupersets', left, right), split, self.cache)
+
+    def product(self, left, right):
+        # the unions of a set of left and a set of right.
+        def split(key):
+            _, left, right = key
+            if FALSE in (left, right):
+                return result(FALSE)
+            if TRUE in (left, right):
+                return result(right if left == TRUE else left)
+            level = min(self.level(left), self.level(right))
+            (left_low, left_high), (right_low, right_high) = self.zero_cofactors(left, level), self.zero_cofactors(right, level)
+            return (('product', *sorted((left_low, right_low))), ('product', *sorted((left_high, right_low))),
+                    ('product', *sorted((left_low, right_high))), ('product', *sorted((left_high, right_high)))), \
+                lambda low, high, other, both: self.node(level, low, self.union(self.union(high, other), both))
+
+        return evaluate(('product', *sorted((left, right))), split, self.cache)
+
+    def minimal(self, node):
+        # the sets including no other set of the family.
+        def split(key):
+            _, node = key
+            if node in (FALSE, TRUE):
+                return result(node)
+            level, low, high = self.nodes[node]
+            return (('minimal', low), ('minimal', high)), lambda low, high: self.node(level, low, self.nonsupersets(high, low))
+
+        return evaluate(('minimal', node), split, self.cache)
+
+    def abstract(self, node, levels):
+        # the sets with the variables of the levels taken out of them.
+        def split(key):
+            _, levels, node = key
+            if node in (FALSE, TRUE):
+                return result(node)
+            level, low, high = self.nodes[node]
+            if level in levels:
+                return (('abstract', levels, low), ('abstract', levels, high)), self.union
+            return (('abstract', levels, low), ('abstract', levels, high)), lambda low, high: self.node(level, low, high)
+
+        return evaluate(('abstract', frozenset(levels), node), split, self.cache)
+
+    def includes(self, node, levels):
+        # whether the family has the set of the variables of the levels, following a single path.
+        for level in sorted(levels):
+            while self.level(node) < level:
+                node = self.nodes[node][1]
+            if self.level(node) != level:
+                return False
+            node = self.nodes[node][2]
+        while node not in (FALSE, TRUE):
+            node = self.nodes[node][1]
+        return node == TRUE
+
+    def offset(self, node, level):
+        # the sets without the variable of the level.
+        def split(key):
+            _, level, node = key
+            node_level, low, high = self.nodes[node]
+            if node_level > level:
+                return result(node)
+            if node_level == level:
+                return result(low)
+            return (('offset', level, low), ('offset', level, high)), lambda low, high: self.node(node_level, low, high)
+
+        return evaluate(('offset', level, node), split, self.cache)
+
+    def occurrences(self, node):
+        # the number of sets including each variable, by the levels, counting the paths from the root down to every node
+        # and those from it to the terminal, in time proportional to the size of the diagram.
+        counts = {FALSE: 0, TRUE: 1}
+        reachable = sorted(self.reachable(node)) # the operands of a node are made before it.
+        for reached in reachable:
+            if reached not in counts:
+                counts[reached] = counts[self.nodes[reached][1]] + counts[self.nodes[reached][2]]
+        paths = dict.fromkeys(reachable, 0)
+        paths[node] = 1
+        occurrences = [0] * len(self.variables)
+        for reached in reversed(reachable):
+            if reached not in (FALSE, TRUE):
+                level, low, high = self.nodes[reached]
+                occurrences[level] += paths[reached] * counts[high]
+                paths[low] += paths[reached]
+                paths[high] += paths[reached]
+        return occurrences
+
+    def reachable(self, node):
+        seen = {node}
+        stack = [node]
+        while stack:
+            for child in self.nodes[stack.pop()][1:]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def count(self, node):
+        # the number of sets, in time proportional to the size of the diagram.
+        return evaluate(node, lambda node: result(node) if node in (FALSE, TRUE) else
+                        (self.nodes[node][1:], lambda low, high: low + high), {})
+
+    def count_by_size(self, node):
+        # the number of sets of every size, as a list indexed by the sizes.
+        def add(low, high):
+            sizes = [0] * max(len(low), len(high) + 1)
+            for size, count in enumerate(low):
+                sizes[size] += count
+            for size, count in enumerate(high):
+                sizes[size + 1] += count
+            return sizes
+
+        return evaluate(node, lambda node: result([0]) if node == FALSE else result([1]) if node == TRUE else
+                        (self.nodes[node][1:], add), {})
+
+    def sets(self, node):
+        # every set of the family as a frozenset of the variables, depth first without recursion.
+        stack = [(node, ())]
+        while stack:
+            node, chosen = stack.pop()
+            if node == TRUE:
+                yield frozenset(self.variables[level] for level in chosen)
+            elif node != FALSE:
+                level, low, high = self.nodes[node]
+                stack.append((low, chosen))
+                stack.append((high, (*chosen, level)))
+
+
+def order_variables(formula, root):
+    # orders the conditions depth first from the root, left to right, so that those used together stay close.
+    ordered = {}
+    seen = set()
+    stack = [root]
+    while stack:
+        if (formula_id := stack.pop()) in seen:
+            continue
+        seen.add(formula_id)
+        kind, operands = formula.expressions[formula_id]
+        if kind == 'condition':
+            ordered.setdefault(operands)
+        else:
+            stack.extend(reversed(operands))
+    return list(ordered)
+
+
+def compile_formula(formula, root, bdd=None):
+    # returns the BDD of a Formula from utils.build_formula() along with its root.
+    if bdd is None:
+        bdd = BDD(order_variables(formula, root))
+    levels = {variable: level for level, variable in enumerate(bdd.variables)}
+
+    def split(formula_id):
+        kind, operands = formula.expressions[formula_id]
+        if kind == 'condition':
+            return result(bdd.node(levels[operands], FALSE, TRUE))
+        return operands, (lambda *nodes: bdd.conjoin(*nodes)) if kind == 'and' else (lambda *nodes: bdd.disjoin(*nodes))
+
+    return bdd, evaluate(root, split, {})
+
+
+def compile_cut_sets(formula, root, zdd=None):
+    # returns the ZDD of the minimal cut sets of a Formula along with its root, without building the BDD.
+    if zdd is None:
+        zdd = ZDD(order_variables(formula, root))
+    levels = {variable: level for level, variable in enumerate(zdd.variables)}
+
+    def conjoin(*nodes):
+        conjunction = TRUE
+        for node in nodes:
+            conjunction = zdd.minimal(zdd.product(conjunction, node))
+        return conjunction
+
+    def disjoin(*nodes):
+        # the union is made minimal only once, and taken pairwise, so as not to go over a growing family for every operand.
+        nodes = list(nodes) or [FALSE]
+        while len(nodes) > 1:
+            nodes = [zdd.union(*nodes[i:i + 2]) if i + 1 < len(nodes) else nodes[i] for i in range(0, len(nodes), 2)]
+        return zdd.minimal(nodes[0])
+
+    def split(formula_id):
+        kind, operands = formula.expressions[formula_id]
+        if kind == 'condition':
+            return result(zdd.node(levels[operands], FALSE, TRUE))
+        return operands, conjoin if kind == 'and' else disjoin
+
+    return zdd, evaluate(root, split, {})
+
+
+def minimal_cut_sets(bdd, root):
+    # returns the ZDD of the minimal cut sets of a monotone BDD along with its root.
+    zdd = ZDD(bdd.variables)
+
+    def split(node):
+        if node in (FALSE, TRUE):
+            return result(node)
+        level, low, high = bdd.nodes[node]
+        return (low, high), lambda low, high: zdd.node(level, low, zdd.nonsupersets(high, low))
+
+    return zdd, evaluate(root, split, {})
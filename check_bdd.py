@@ -0,0 +1,44 @@
+import random
+import sys
+
+from bdd import FALSE, TRUE, ZDD
+
+
+def random_family(rng, variables):
+    return {frozenset(v for v in range(variables) if rng.random() < 0.4) for _ in range(rng.randrange(6))}
+
+
+def check_zdd(trials, seed, variables=5):
+    # cross-checks the operations of the ZDD on random families against the same operations on sets of frozensets.
+    rng = random.Random(seed)
+    for _ in range(trials):
+        zdd = ZDD(range(variables))
+
+        def build(family):
+            root = FALSE
+            for s in family:
+                node = TRUE
+                for level in sorted(s, reverse=True):
+                    node = zdd.node(level, FALSE, node)
+                root = zdd.union(root, node)
+            return root
+
+        left, right = random_family(rng, variables), random_family(rng, variables)
+        levels = {v for v in range(variables) if rng.random() < 0.4}
+        l, r = build(left), build(right)
+        assert set(zdd.sets(l)) == left
+        assert set(zdd.sets(zdd.union(l, r))) == left | right
+        assert set(zdd.sets(zdd.nonsupersets(l, r))) == {a for a in left if not any(b <= a for b in right)}
+        assert set(zdd.sets(zdd.product(l, r))) == {a | b for a in left for b in right}
+        assert set(zdd.sets(zdd.minimal(l))) == {a for a in left if not any(b < a for b in left)}
+        assert set(zdd.sets(zdd.abstract(l, levels))) == {a - levels for a in left}
+        assert zdd.includes(l, levels) == (levels in left)
+        assert zdd.count(l) == len(left)
+
+
+if __name__ == '__main__':
+    # the number of trials and the seed are optional arguments.
+    trials = int(sys.argv[1]) if sys.argv[1:] else 300
+    seed = int(sys.argv[2]) if sys.argv[2:] else 0
+    check_zdd(trials, seed)
+    print(f'ZDD operations: {trials} random trials passed')
@@ -0,0 +1,28 @@
+import random
+import sys
+from itertools import combinations
+
+from check_bdd import random_family
+from countermeasures import select_exactly
+
+
+def check_branch_and_bound(trials, seed, conditions=6):
+    # cross-checks select_exactly() on random cut sets and costs against every selection.
+    rng = random.Random(seed)
+    for _ in range(trials):
+        cut_sets = [s for s in random_family(rng, conditions) if s]
+        costs = [rng.randint(1, 5) for _ in range(conditions)]
+        cost = lambda selection: sum(costs[c] for c in selection)
+        best = min((selection for size in range(conditions + 1) for selection in combinations(range(conditions), size)
+                    if all(set(selection) & s for s in cut_sets)), key=cost)
+        selected = select_exactly(cut_sets, costs.__getitem__, range(conditions), 100000)
+        assert all(set(selected) & s for s in cut_sets)
+        assert cost(selected) == cost(best), (cut_sets, costs, selected, best)
+
+
+if __name__ == '__main__':
+    # the number of trials and the seed are optional arguments.
+    trials = int(sys.argv[1]) if sys.argv[1:] else 300
+    seed = int(sys.argv[2]) if sys.argv[2:] else 0
+    check_branch_and_bound(trials, seed)
+    print(f'branch and bound: {trials} random trials passed')
@@ -1,6 +1,7 @@
 import os
+import re
 import sys
-from utils import load_attack_graph, fact_to_label
+from utils import CompactAttackGraph, load_attack_graph, fact_to_label
 
 if len(sys.argv) < 2:
     print('arguments missing')
@@ -9,11 +10,51 @@ if len(sys.argv) < 2:
 
 goals = ('interrupted', 'leaked', 'productsSentToWrongPlace', 'moneySentToWrongAccount', 'accidentsOccur')
 
-ag = load_attack_graph(sys.argv[1])
+# goals can also be given as arguments such as "leaked(customers)", where capitalized arguments are free.
+queries = [(goal,) for goal in goals]
+if sys.argv[2:]:
+    queries = []
+    for goal in sys.argv[2:]:
+        if not (matched := re.fullmatch(r'(\w+)(?:\((.*)\))?', goal)):
+            print(f'malformed goal: {goal} (expected such as "leaked(customers)" or "leaked(X)")')
+            exit(1)
+        pred, args = matched.groups()
+        args = [arg.strip() for arg in (args or '').split(',') if arg.strip()]
+        queries.append((pred, *(None if arg[0].isupper() else arg for arg in args)))
 
 
-for goal in ag.filter_facts_with_pred(*goals):
-    print(fact_to_label(goal))
+def matches(fact, query):
+    return fact[0] == query[0] and all(arg is None or arg == val for arg, val in zip(query[1:], fact[1:]))
+
+
+if os.path.splitext(sys.argv[1])[1] == '.d':
+    # queries the datalog program directly, deriving only the instances relevant to the goals.
+    sys.path.append(os.path.join(os.path.dirname(__file__), 'datalog'))
+    from datalog import load_program
+
+    with open(sys.argv[1], encoding='utf-8') as program:
+        processor, _ = load_program(program.read())
+    try:
+        ag = CompactAttackGraph.from_instances(processor.query(queries))
+    except ValueError as e:
+        print(f'bad goal: {e}')
+        exit(1)
+else:
+    ag = load_attack_graph(sys.argv[1], compact=True)
+    # the goals given are checked like in DatalogProcessor.query(), against the conditions derived in the graph.
+    arities = {condition[0]: len(condition) - 1 for condition in ag.conditions - ag.initial_conditions}
+    for pred, *args in queries if sys.argv[2:] else ():
+        if pred not in arities:
+            print(f'bad goal: {pred} is derived in no instance')
+            exit(1)
+        if args and len(args) != arities[pred]:
+            print(f'bad goal: {pred} takes {arities[pred]} arguments, not {len(args)}')
+            exit(1)
+
+
+for goal in ag.filter_facts_with_pred(*{pred for pred, *_ in queries}):
+    if any(matches(goal, query) for query in queries):
+        print(fact_to_label(goal))
 
 # assets|customers|human_resources|materials|purchase_contracts|sales_contracts
 # accounting_office|administration_office|customer_support_office|human_resource_office|production_office
@@ -0,0 +1,95 @@
+import os
+import sys
+
+from bdd import FALSE, TRUE
+from utils import fact_to_label, load_attack_graph
+
+control_targets = ('noProtection', 'noEncryption', 'noRedundancy', 'noLoadBalancing', 'isVulnerable')
+
+
+def select_greedily(zdd, root, costs):
+    # repeatedly removes the condition included in the most cut sets left for its cost, counting them on the ZDD.
+    selected = []
+    while root != FALSE:
+        if root == TRUE:
+            raise ValueError("a goal is reached without any of the control targets")
+        occurrences = zdd.occurrences(root)
+        level = max((level for level, count in enumerate(occurrences) if count), key=lambda level: occurrences[level] / costs(zdd.variables[level]))
+        selected.append(zdd.variables[level])
+        root = zdd.offset(root, level)
+    return selected
+
+
+def select_exactly(cut_sets, costs, selected, budget):
+    # branch and bound on the cut sets left unhit: every condition of the smallest one is tried in turn, each excluded
+    # from the later tries, and a branch is bounded below by the cheapest conditions of cut sets disjoint from each other.
+    # the best selection so far is returned once the budget of branches is spent, starting from the given one.
+    cut_sets = [frozenset(cut_set) for cut_set in cut_sets]
+    best_cost, best = sum(map(costs, selected)), list(selected)
+    stack = [((), 0, cut_sets, frozenset())]
+    while stack and budget > 0:
+        budget -= 1
+        chosen, cost, unhit, excluded = stack.pop()
+        if not unhit:
+            if cost < best_cost:
+                best_cost, best = cost, list(chosen)
+            continue
+
+        bound = cost
+        covered = set()
+        for cut_set in sorted(unhit, key=len):
+            if not cut_set & covered:
+                bound += min(map(costs, cut_set - excluded), default=float('inf'))
+                covered |= cut_set
+        if bound >= best_cost:
+            continue
+
+        branches = sorted(min(unhit, key=lambda cut_set: len(cut_set - excluded)) - excluded, key=costs)
+        for i, condition in enumerate(branches):
+            stack.append(((*chosen, condition), cost + costs(condition),
+                          [cut_set for cut_set in unhit if condition not in cut_set], excluded | set(branches[:i])))
+    return best
+
+
+def select_countermeasures(graph, goals, control_targets, costs=None, limit=10000, budget=100000):
+    # the control targets of least total cost blocking every goal; a ValueError names the goals nothing blocks.
+    goals = list(goals)
+    if not goals:
+        return 0, set()
+    controllable = {c for c in graph.initial_conditions if c[0] in control_targets} - {('noProtection', 'the_internet')}
+    if unblockable := graph.get_derivable(controllable) & set(goals):
+        raise ValueError(f"goals reached without any of the control targets: {', '.join(sorted(map(fact_to_label, unblockable)))}")
+    cost = (lambda condition: costs.get(condition, 1)) if costs else (lambda condition: 1)
+    zdd, root = graph.get_cut_sets(goals, control_targets, any_goal=True)
+    selected = select_greedily(zdd, root, cost)
+    if zdd.count(root) <= limit:
+        selected = select_exactly(zdd.sets(root), cost, selected, budget)
+
+    # what is left of the cut sets to the selected conditions, each of which is needed only if it is left alone in one.
+    levels = {variable: level for level, variable in enumerate(zdd.variables)}
+    left = zdd.abstract(root, set(range(len(zdd.variables))) - {levels[condition] for condition in selected})
+    for condition in sorted(selected, key=cost, reverse=True):
+        if not zdd.includes(left, [levels[condition]]):
+            selected.remove(condition)
+            left = zdd.abstract(left, [levels[condition]])
+    if graph.get_derivable(selected) & set(goals):
+        raise ValueError("the goals are reached despite the countermeasures")
+    return sum(map(cost, selected)), set(selected)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('arguments missing')
+        exit(1)
+
+    # the goals of check_goals.py, and the control targets optionally given as arguments.
+    ag = load_attack_graph(sys.argv[1], compact=True)
+    goals = ag.filter_facts_with_pred('interrupted', 'leaked', 'productsSentToWrongPlace', 'moneySentToWrongAccount', 'accidentsOccur')
+    try:
+        total, selected = select_countermeasures(ag, goals, sys.argv[2:] or control_targets)
+    except ValueError as e:
+        print(f"{os.path.basename(sys.argv[1])}: {e}")
+        exit(1)
+    print(f"{os.path.basename(sys.argv[1])}: {len(selected)} countermeasures")
+    for condition in sorted(selected):
+        print(fact_to_label(condition))
@@ -0,0 +1,9 @@
+import struct
+
+# The binary format of the instances (*.ag), written by datalog.py and read by utils.load_attack_graph(): a header
+# followed by little-endian unsigned 32-bit words, namely the instances, each its length and the IDs of its head and
+# body facts, then the offsets and the string IDs of the facts, each a predicate followed by its arguments,
+# and last the offsets and the UTF-8 bytes of the strings, padded to a whole word.
+# The header is written last, so a file whose writing did not finish has no magic.
+MAGIC, VERSION = b'DLAG', 1
+HEADER = struct.Struct('<4sIQQQQQ') # magic, version, and the numbers of instance words, facts, fact words, strings and string bytes.
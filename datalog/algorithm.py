@@ -1,17 +1,42 @@
-from collections import defaultdict
-from collections.abc import Iterable
-from functools import reduce
-from typing import Any, Optional, Union
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+from functools import cache
+from typing import Any, Optional, Protocol, Union
 
-Atom = str
+class SymbolTable:
+    # dense integer IDs for the names of atoms and predicates.
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        if (symbol := self.ids.get(name)) is None:
+            symbol = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+    def __getitem__(self, symbol: int) -> str:
+        return self.names[symbol]
+
+    def restore(self, fact: tuple[int, ...]) -> tuple[str, ...]:
+        return tuple(self.names[symbol] for symbol in fact)
+
+
+symbols = SymbolTable() # shared by the parser, the engine and the output; the engine works on the IDs only.
+
+Atom = int
 
 
 class Variable:
+    __slots__ = ('name', 'hash')
+
     def __init__(self, name: str):
         self.name = name
+        self.hash = hash(name)
 
     def __hash__(self) -> int:
-        return self.name.__hash__()
+        return self.hash
 
     def __eq__(self, another: Any) -> bool:
         return isinstance(another, Variable) and self.name == another.name
@@ -20,73 +45,408 @@ class Variable:
         return f'Variable(name={self.name})'
 
 
-Predicate = str
+Predicate = int
 Argument = Union[Atom, Variable]
 Term = tuple[Predicate, Argument, ...]
 Fact = tuple[Predicate, Atom, ...]
 Rule = tuple[Term, ...]
 Instance = tuple[Fact, ...]
-LookupKey = tuple[Predicate, int, Atom]
 
 
-def bind(terms: Iterable[Term], bindings: dict[Argument, Atom]) -> tuple[Term, ...]:
-    return tuple((pred, *(bindings.get(arg, arg) for arg in args)) for pred, *args in terms)
+Positions = tuple[int, ...]
+
+
+class Statistics(Protocol):
+    def size(self, pred: Predicate) -> int:
+        ...
+
+    def count(self, pred: Predicate, position: int, atom: Atom) -> int:
+        ...
+
+    def distinct(self, pred: Predicate, position: int) -> int:
+        ...
+
+
+class FactStore:
+    # the facts of each predicate, with an index built on demand for every set of bound positions.
+
+    def __init__(self, facts: Iterable[Fact] = ()):
+        self.relations: dict[Predicate, set[Fact]] = defaultdict(set)
+        self.indexes: dict[Predicate, dict[Positions, dict[tuple[Atom, ...], set[Fact]]]] = defaultdict(dict)
+        self.columns: dict[tuple[Predicate, int], Counter[Atom]] = defaultdict(Counter) # the distinct atoms at each argument position.
+        for fact in facts:
+            self.add(fact)
 
+    def __contains__(self, fact: Fact) -> bool:
+        return fact in self.relations.get(fact[0], ())
 
-def collate(term: Term, fact: Fact) -> Optional[dict[Argument, Atom]]:
-    if all(arg == val or isinstance(arg, Variable) for arg, val in zip(term, fact)):
-        return {arg: val for arg, val in zip(term, fact) if isinstance(arg, Variable)}
-    else:
-        return None
+    def size(self, pred: Predicate) -> int:
+        return len(self.relations.get(pred, ()))
 
+    def count(self, pred: Predicate, position: int, atom: Atom) -> int:
+        return len(self.lookup(pred, (position,), (atom,)))
 
-def lookup_keys(term: Term) -> Iterable[LookupKey]:
+    def distinct(self, pred: Predicate, position: int) -> int:
+        return len(self.columns.get((pred, position), ()))
+
+    def add(self, fact: Fact) -> bool:
+        pred, *args = fact
+        if fact in (relation := self.relations[pred]):
+            return False
+        relation.add(fact)
+        for i, arg in enumerate(args):
+            self.columns[pred, i][arg] += 1
+        for positions, index in self.indexes[pred].items():
+            index.setdefault(tuple(args[i] for i in positions), set()).add(fact)
+        return True
+
+    def remove(self, fact: Fact) -> bool:
+        pred, *args = fact
+        if fact not in (relation := self.relations[pred]):
+            return False
+        relation.remove(fact)
+        for i, arg in enumerate(args):
+            (column := self.columns[pred, i])[arg] -= 1
+            if not column[arg]:
+                del column[arg]
+        for positions, index in self.indexes[pred].items():
+            (bucket := index[key := tuple(args[i] for i in positions)]).remove(fact)
+            if not bucket:
+                del index[key]
+        return True
+
+    def index(self, pred: Predicate, positions: Positions) -> dict[tuple[Atom, ...], set[Fact]]:
+        if (index := self.indexes[pred].get(positions)) is None:
+            index = self.indexes[pred][positions] = {}
+            for fact in self.relations.get(pred, ()):
+                index.setdefault(tuple(fact[i + 1] for i in positions), set()).add(fact)
+        return index
+
+    def lookup(self, pred: Predicate, positions: Positions, values: tuple[Atom, ...]) -> set[Fact]:
+        if not positions:
+            return self.relations.get(pred, set())
+        return self.index(pred, positions).get(values, set())
+
+
+def term_to_str(term: Term) -> str:
     pred, *args = term
-    yield pred, -1, None
-    for i, arg in enumerate(args):
-        if not isinstance(arg, Variable):
-            yield pred, i, arg
+    return f"{symbols[pred]}({', '.join(arg.name if isinstance(arg, Variable) else symbols[arg] for arg in args)})"
+
+
+class Planner:
+    # orders the body terms of each rule by their estimated matches, revised as the relations grow.
 
+    def __init__(self, store: Statistics, explain: Optional[Callable[[str], Any]] = None):
+        self.store = store
+        self.explain = explain
+        self.plans: dict[tuple[Rule, Optional[int]], tuple[tuple[int, ...], tuple[int, ...]]] = {}
 
-def unify(rule: Rule, keyed_facts: dict[LookupKey, set[Fact]]) -> Iterable[Instance]:
+    def estimate(self, term: Term, bound: set[Variable]) -> float:
+        pred, *args = term
+        if not (size := self.store.size(pred)):
+            return 0.0
+        estimated = float(size)
+        for i, arg in enumerate(args):
+            if not isinstance(arg, Variable):
+                estimated *= self.store.count(pred, i, arg) / size
+            elif arg in bound:
+                estimated /= max(self.store.distinct(pred, i), 1)
+        return estimated
 
-    def unify_terms(terms: Iterable[Term]) -> Iterable[tuple[Iterable[Term], dict[Argument, Atom]]]:
-        head, *tail = terms
-        if relevant_facts := [keyed_facts[lookup_key] for lookup_key in lookup_keys(head) if lookup_key in keyed_facts]:
-            for fact in reduce(lambda a, b: a & b, relevant_facts):
-                if (bindings := collate(head, fact)) is not None:
-                    for unified_tail, tail_bindings in (unify_terms(bind(tail, bindings)) if tail else [([], {})]):
-                        yield [head] + unified_tail, {**bindings, **tail_bindings}
+    def plan(self, rule: Rule, pivot: Optional[int] = None) -> tuple[int, ...]:
+        rule_head, *rule_body = rule
+        sizes = tuple(self.store.size(pred) for pred, *_ in rule_body)
+        if (cached := self.plans.get((rule, pivot))) and cached[0] == sizes:
+            return cached[1]
 
+        bound = {arg for arg in rule_body[pivot][1:] if isinstance(arg, Variable)} if pivot is not None else set()
+        remaining = [i for i in range(len(rule_body)) if i != pivot]
+        order, estimates = [], []
+        while remaining:
+            estimated, best = min((self.estimate(rule_body[i], bound), i) for i in remaining)
+            remaining.remove(best)
+            order.append(best)
+            estimates.append(estimated)
+            bound.update(arg for arg in rule_body[best][1:] if isinstance(arg, Variable))
+
+        self.plans[(rule, pivot)] = sizes, tuple(order)
+        if self.explain:
+            steps = ([f'delta {term_to_str(rule_body[pivot])}'] if pivot is not None else []) + \
+                    [f'{term_to_str(rule_body[i])} ~{estimated:.1f}' for i, estimated in zip(order, estimates)]
+            self.explain(f"{term_to_str(rule_head)} <- {', '.join(steps)}")
+        return tuple(order)
+
+
+Join = Callable[[FactStore, dict[Predicate, set[Fact]]], Iterable[Instance]]
+
+
+@cache
+def compile_join(rule: Rule, pivot: Optional[int], order: tuple[int, ...]) -> Join:
+    # a join specialized to the rule, its delta pivot and the order of the rest of its body.
     rule_head, *rule_body = rule
-    for unified_body, body_bindings in unify_terms(rule_body):
-        yield bind([rule_head] + unified_body, body_bindings)
+    constants: dict[Atom, str] = {}
+    slots: dict[Variable, str] = {}
+    prologue: list[str] = []
+    lines: list[str] = []
+
+    def constant(atom: Atom) -> str:
+        return constants.setdefault(atom, f'c{len(constants)}')
+
+    def value(arg: Argument) -> str:
+        return slots[arg] if isinstance(arg, Variable) else constant(arg)
 
+    for depth, i in enumerate(([pivot] if pivot is not None else []) + list(order)):
+        pred, *args = rule_body[i]
+        positions = () if i == pivot else tuple(p for p, arg in enumerate(args) if not isinstance(arg, Variable) or arg in slots)
+        if i == pivot:
+            source = f'delta.get({constant(pred)}, EMPTY)'
+        elif positions:
+            prologue.append(f'index{i} = store.index({constant(pred)}, {positions!r})')
+            source = f"index{i}.get(({''.join(value(args[p]) + ', ' for p in positions)}), EMPTY)"
+        else:
+            prologue.append(f'relation{i} = store.relations.get({constant(pred)}, EMPTY)')
+            source = f'relation{i}'
 
-def edge_rules(rules: set[Rule], edge_facts: set[Fact]) -> set[Rule]:
-    return {bind(rule, bindings)
-            for rule in rules
-            for term in rule[1:] # terms in the body of the rule.
-            for edge_fact in edge_facts
-            if (bindings := collate(term, edge_fact)) is not None}
+        indent = '    ' * (depth + 1)
+        lines.append(f'{indent}for f{i} in {source}:')
+        if pivot is not None and i < pivot:
+            prologue.append(f'older{i} = delta.get({constant(pred)}, EMPTY)')
+            lines.append(f'{indent}    if f{i} in older{i}: continue')
+        for p, arg in enumerate(args):
+            if p in positions:
+                continue
+            if not isinstance(arg, Variable) or arg in slots:
+                lines.append(f'{indent}    if f{i}[{p + 1}] != {value(arg)}: continue')
+            else:
+                slots[arg] = f'v{len(slots)}'
+                lines.append(f'{indent}    {slots[arg]} = f{i}[{p + 1}]')
 
+    head_pred, *head_args = rule_head
+    head = f"({constant(head_pred)}, {''.join(value(arg) + ', ' for arg in head_args)})"
+    body = ''.join(f'f{i}, ' for i in range(len(rule_body)))
+    lines.append(f"{'    ' * (len(rule_body) + 1)}yield ({head}, {body})")
 
-def process(rules: Iterable[Rule], facts: Iterable[Fact]) -> Iterable[Instance]:
+    source = '\n'.join(['def join(store, delta):'] + [f'    {line}' for line in prologue] + lines)
+    namespace = {name: atom for atom, name in constants.items()} | {'EMPTY': frozenset()}
+    exec(compile(source, f'<join {term_to_str(rule_head)}>', 'exec'), namespace)
+    return namespace['join']
 
-    edge_facts = set(facts)
-    keyed_facts: dict[LookupKey, set[Fact]] = defaultdict(set)
-    for fact in facts:
-        for lookup_key in lookup_keys(fact):
-            keyed_facts[lookup_key].add(fact)
 
-    while instances := {instance for rule in edge_rules(rules, edge_facts) for instance in unify(rule, keyed_facts)}:
-        for instance in instances:
+def stratify(rules: Iterable[Rule]) -> list[list[Rule]]:
+    # the strongly connected components of the predicate dependencies, in topological order.
+    depends_on: dict[Predicate, set[Predicate]] = defaultdict(set)
+    rules_of: dict[Predicate, list[Rule]] = defaultdict(list)
+    for rule in rules:
+        (head_pred, *_), *rule_body = rule
+        depends_on[head_pred].update(pred for pred, *_ in rule_body)
+        rules_of[head_pred].append(rule)
+
+    # Tarjan's algorithm without recursion; a component is completed after all the ones it depends on.
+    strata: list[list[Rule]] = []
+    numbers: dict[Predicate, int] = {}
+    lowlinks: dict[Predicate, int] = {}
+    stack: list[Predicate] = []
+    on_stack: set[Predicate] = set()
+    for root in list(depends_on):
+        if root in numbers:
+            continue
+        numbers[root] = lowlinks[root] = len(numbers)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(depends_on[root]))]
+        while work:
+            pred, successors = work[-1]
+            if (successor := next(successors, None)) is not None:
+                if successor not in numbers:
+                    numbers[successor] = lowlinks[successor] = len(numbers)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(depends_on.get(successor, ()))))
+                elif successor in on_stack:
+                    lowlinks[pred] = min(lowlinks[pred], numbers[successor])
+                continue
+
+            work.pop()
+            if work:
+                lowlinks[work[-1][0]] = min(lowlinks[work[-1][0]], lowlinks[pred])
+            if lowlinks[pred] == numbers[pred]:
+                component = []
+                while (member := stack.pop()) != pred:
+                    on_stack.remove(member)
+                    component.append(member)
+                on_stack.remove(pred)
+                component.append(pred)
+                if stratum := [rule for member in component for rule in rules_of.get(member, ())]:
+                    strata.append(stratum)
+    return strata
+
+
+def saturate(stratum: list[Rule], store: FactStore, planner: Planner,
+             delta: Optional[dict[Predicate, set[Fact]]] = None) -> Iterable[tuple[dict[Instance, None], dict[Predicate, set[Fact]]]]:
+    # yields the instances and the new facts of each iteration until the stratum reaches its fixpoint.
+    joins: list[tuple[Rule, Optional[int]]] = [(rule, None) for rule in stratum] if delta is None else \
+        [(rule, pivot) for rule in stratum for pivot, (pred, *_) in enumerate(rule[1:]) if pred in delta]
+    delta = delta or {}
+    # the instances of each join are sorted, as the order of the sets they come from is not reproduced by the other modes.
+    while instances := dict.fromkeys(instance
+                                     for rule, pivot in joins
+                                     for instance in sorted(compile_join(rule, pivot, planner.plan(rule, pivot))(store, delta))):
+        delta = defaultdict(set)
+        for inferred_fact, *_ in instances:
+            if store.add(inferred_fact):
+                delta[inferred_fact[0]].add(inferred_fact)
+        yield instances, delta
+        joins = [(rule, pivot) for rule in stratum for pivot, (pred, *_) in enumerate(rule[1:]) if pred in delta]
+
+
+def report(progress: Optional[Callable[[str], Any]], stratum: int, strata: int, iteration: int, instances: int, facts: int):
+    if progress:
+        progress(f"stratum {stratum}/{strata}, iteration {iteration}: {instances} instances, {facts} new facts")
+
+
+def process(rules: Iterable[Rule], facts: Iterable[Fact], explain: Optional[Callable[[str], Any]] = None,
+            progress: Optional[Callable[[str], Any]] = None) -> Iterable[Instance]:
+    # yields every instance, one iteration at a time.
+    store = FactStore(facts)
+    planner = Planner(store, explain)
+
+    # Each stratum is evaluated to its own fixpoint and never revisited.
+    strata = stratify(rules)
+    for number, stratum in enumerate(strata, 1):
+        for iteration, (instances, inferred) in enumerate(saturate(stratum, store, planner), 1):
+            report(progress, number, len(strata), iteration, len(instances), sum(map(len, inferred.values())))
+            yield from instances
+
+
+Goal = tuple[Predicate, Optional[Atom], ...]
+
+
+def magic_rewrite(rules: Iterable[Rule], goals: Iterable[Goal]) -> tuple[list[Rule], list[Fact], set[Predicate]]:
+    # the magic-sets rewriting of the rules for the goals, with its seed facts and magic predicates.
+    rules_of: dict[Predicate, list[Rule]] = defaultdict(list)
+    for rule in rules:
+        rules_of[rule[0][0]].append(rule)
+
+    def magic(pred: Predicate, positions: Positions) -> Predicate:
+        return symbols.intern(f"magic_{symbols[pred]}@{','.join(map(str, positions))}")
+
+    seeds: list[Fact] = []
+    worklist: list[tuple[Predicate, Positions]] = []
+    for pred, *args in goals:
+        positions = tuple(i for i, arg in enumerate(args) if arg is not None)
+        seeds.append((magic(pred, positions), *(args[i] for i in positions)))
+        worklist.append((pred, positions))
+
+    rewritten: dict[Rule, None] = {}
+    adorned: set[tuple[Predicate, Positions]] = set()
+    while worklist:
+        if (adornment := worklist.pop()) in adorned:
+            continue
+        adorned.add(adornment)
+        pred, positions = adornment
+        for rule_head, *rule_body in rules_of.get(pred, ()):
+            magic_term = (magic(pred, positions), *(rule_head[i + 1] for i in positions))
+            rewritten[(rule_head, magic_term, *rule_body)] = None
+            bound = {arg for arg in magic_term[1:] if isinstance(arg, Variable)}
+            for k, (body_pred, *args) in enumerate(rule_body):
+                if body_pred in rules_of:
+                    body_positions = tuple(i for i, arg in enumerate(args) if not isinstance(arg, Variable) or arg in bound)
+                    rewritten[((magic(body_pred, body_positions), *(args[i] for i in body_positions)), magic_term, *rule_body[:k])] = None
+                    worklist.append((body_pred, body_positions))
+                bound.update(arg for arg in args if isinstance(arg, Variable))
+
+    return list(rewritten), seeds, {magic(pred, positions) for pred, positions in adorned}
+
+
+def query(rules: Iterable[Rule], facts: Iterable[Fact], goals: Iterable[Goal],
+          explain: Optional[Callable[[str], Any]] = None) -> Iterable[Instance]:
+    # only the instances relevant to the goals.
+    rewritten, seeds, magic_preds = magic_rewrite(rules, goals)
+    yielded: set[Instance] = set()
+    for rule_head, magic_fact, *rule_body in process(rewritten, [*facts, *seeds], explain):
+        if rule_head[0] not in magic_preds and (instance := (rule_head, *rule_body)) not in yielded:
+            yielded.add(instance)
             yield instance
 
-        edge_facts = set()
-        for inferred_fact in {inferred_fact for inferred_fact, *_ in instances}:
-            if inferred_fact not in keyed_facts[next(lookup_keys(inferred_fact))]:
-                edge_facts.add(inferred_fact)
-            for lookup_key in lookup_keys(inferred_fact):
-                keyed_facts[lookup_key].add(inferred_fact)
 
+class Session:
+    # the fixpoint kept up to date as base facts are inserted or deleted (delete and rederive).
+
+    def __init__(self, rules: Iterable[Rule], facts: Iterable[Fact] = (), explain: Optional[Callable[[str], Any]] = None):
+        self.strata = stratify(rules)
+        self.store = FactStore()
+        self.planner = Planner(self.store, explain)
+        self.base: set[Fact] = set()
+        self.instances: set[Instance] = set()
+        self.supports: dict[Fact, set[Instance]] = defaultdict(set) # the instances deriving each fact.
+        self.uses: dict[Fact, set[Instance]] = defaultdict(set) # the instances having each fact in their bodies.
+
+        for fact in facts:
+            self.base.add(fact)
+            self.store.add(fact)
+        for stratum in self.strata:
+            for instances, _ in saturate(stratum, self.store, self.planner):
+                for instance in instances:
+                    self.remember(instance)
+
+    def remember(self, instance: Instance):
+        self.instances.add(instance)
+        head, *body = instance
+        self.supports[head].add(instance)
+        for fact in body:
+            self.uses[fact].add(instance)
+
+    def forget(self, instance: Instance):
+        self.instances.remove(instance)
+        head, *body = instance
+        self.supports[head].discard(instance)
+        for fact in body:
+            self.uses[fact].discard(instance)
+
+    def propagate(self, delta: dict[Predicate, set[Fact]]) -> set[Instance]:
+        added = set()
+        for stratum in self.strata:
+            for instances, inferred in saturate(stratum, self.store, self.planner, delta):
+                for instance in instances:
+                    self.remember(instance)
+                added.update(instances)
+                for pred, inferred_facts in inferred.items():
+                    delta.setdefault(pred, set()).update(inferred_facts)
+        return added
+
+    def insert(self, facts: Iterable[Fact]) -> tuple[set[Instance], set[Instance]]:
+        # returns the instances added and removed (none).
+        delta: dict[Predicate, set[Fact]] = {}
+        for fact in facts:
+            self.base.add(fact)
+            if self.store.add(fact):
+                delta.setdefault(fact[0], set()).add(fact)
+        return self.propagate(delta), set()
+
+    def delete(self, facts: Iterable[Fact]) -> tuple[set[Instance], set[Instance]]:
+        # returns the instances added (none) and removed.
+        worklist = [fact for fact in facts if fact in self.base]
+        self.base.difference_update(worklist)
+
+        overdeleted: set[Fact] = set()
+        removed: set[Instance] = set()
+        while worklist:
+            if (fact := worklist.pop()) in overdeleted:
+                continue
+            overdeleted.add(fact)
+            for instance in list(self.uses.get(fact, ())):
+                self.forget(instance)
+                removed.add(instance)
+                worklist.append(instance[0])
+        for fact in overdeleted:
+            self.store.remove(fact)
+
+        # every remaining instance has no overdeleted fact in its body.
+        rederived: dict[Predicate, set[Fact]] = {}
+        for fact in overdeleted:
+            if fact in self.base or self.supports.get(fact):
+                self.store.add(fact)
+                rederived.setdefault(fact[0], set()).add(fact)
+
+        added = self.propagate(rederived)
+        return added - removed, removed - added
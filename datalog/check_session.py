@@ -0,0 +1,58 @@
+import random
+import sys
+
+from algorithm import Session, Variable, process, symbols
+from datalog import load_program
+
+
+def check_session(trials, seed, steps=20):
+    # cross-checks the incremental maintenance of a Session on random recursive programs against evaluating them again
+    # from their facts after every change.
+    rng = random.Random(seed)
+    atoms = [symbols.intern(f'a{i}') for i in range(3)]
+    base = [symbols.intern(f'b{i}') for i in range(2)]
+    derived = [symbols.intern(f'd{i}') for i in range(3)]
+    x, y, z = map(Variable, 'XYZ')
+    for _ in range(trials):
+        rules = []
+        for _ in range(rng.randint(1, 5)):
+            body = [(rng.choice(base + derived), *rng.sample([x, y, z], 2)) for _ in range(rng.randint(1, 2))]
+            variables = [arg for _, *args in body for arg in args]
+            rules.append(((rng.choice(derived), rng.choice(variables), rng.choice(variables)), *body))
+        universe = [(pred, a, b) for pred in base for a in atoms for b in atoms]
+        facts = set(rng.sample(universe, 4))
+        session = Session(rules, facts)
+        instances = set(session.instances)
+        for _ in range(steps):
+            changed = set(rng.sample(universe, rng.randint(1, 3)))
+            if rng.random() < 0.5:
+                facts |= changed
+                added, removed = session.insert(changed)
+            else:
+                facts -= changed
+                added, removed = session.delete(changed)
+            instances = instances - removed | added
+            assert instances == set(session.instances) == set(process(rules, facts)), (rules, facts)
+
+
+def check_aggregation(trials, seed, steps=20):
+    # the same through DatalogProcessor, whose facts on the atoms of a group are asserted and retracted one by one.
+    rng = random.Random(seed)
+    universe = [(pred, atom) for pred in ('b0', 'b1') for atom in ('a0', 'a1', 'a2')]
+    for _ in range(trials):
+        processor, _ = load_program('grp = {a0, a1}\nd0(X) :- b0(X).\nd1(X) :- b0(X), b1(X).\n')
+        instances = set(processor.start_session())
+        for _ in range(steps):
+            changed = rng.sample(universe, rng.randint(1, 2))
+            added, removed = (processor.assert_facts if rng.random() < 0.5 else processor.retract_facts)(changed)
+            instances = instances - set(removed) | set(added)
+            assert instances == set(processor.process()), changed
+
+
+if __name__ == '__main__':
+    # the number of trials and the seed are optional arguments.
+    trials = int(sys.argv[1]) if sys.argv[1:] else 100
+    seed = int(sys.argv[2]) if sys.argv[2:] else 0
+    check_session(trials, seed)
+    check_aggregation(trials, seed)
+    print(f'session: {trials} random trials passed')
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from typing import Any, Optional
+
+import numpy as np
+
+from algorithm import Atom, Fact, Instance, Planner, Predicate, Rule, Variable, report, stratify
+
+
+def dense_keys(left: np.ndarray, right: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Maps the rows of both arrays to integers that are equal exactly when the rows are,
+    # by folding the columns into mixed-radix keys, renumbered densely whenever they would overflow.
+    rows = np.concatenate([left, right])
+    keys = np.zeros(len(rows), dtype=np.int64)
+    for column in rows.T:
+        base = int(column.max()) + 1 if len(column) else 1
+        if (int(keys.max()) + 1 if len(keys) else 1) * base >= 2 ** 62:
+            keys = np.unique(keys, return_inverse=True)[1].reshape(-1)
+        keys = keys * base + column
+    return keys[:len(left)], keys[len(left):]
+
+
+def stack(columns: list[np.ndarray], size: int) -> np.ndarray:
+    return np.column_stack(columns) if columns else np.empty((size, 0), dtype=np.int64)
+
+
+def join_indices(left: np.ndarray, right: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Sort-merge join of two key columns, returning the index pairs of all the matching rows.
+    # Only the smaller side is sorted, and the larger one is searched in it.
+    if len(left) < len(right):
+        right_indices, left_indices = join_indices(right, left)
+        return left_indices, right_indices
+    order = np.argsort(right, kind='stable')
+    sorted_right = right[order]
+    lower = np.searchsorted(sorted_right, left, side='left')
+    counts = np.searchsorted(sorted_right, left, side='right') - lower
+    left_indices = np.repeat(np.arange(len(left)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left_indices, order[np.repeat(lower, counts) + offsets]
+
+
+class ColumnarStore:
+    # each relation as an array of atom IDs, rows only appended so the delta is a suffix.
+
+    def __init__(self):
+        self.relations: dict[Predicate, np.ndarray] = {}
+        self.boundaries: dict[Predicate, int] = defaultdict(int)
+        self.facts: dict[Predicate, list[Fact]] = defaultdict(list) # the rows as tuples, to rebuild the instances.
+        self.cache: dict[tuple, int] = {}
+
+    def size(self, pred: Predicate) -> int:
+        return len(self.relations[pred]) if pred in self.relations else 0
+
+    def count(self, pred: Predicate, position: int, atom: Atom) -> int:
+        key = ('count', pred, position, atom, self.size(pred))
+        if key not in self.cache:
+            self.cache[key] = int((self.relations[pred][:, position] == atom).sum()) if key[-1] else 0
+        return self.cache[key]
+
+    def distinct(self, pred: Predicate, position: int) -> int:
+        key = ('distinct', pred, position, self.size(pred))
+        if key not in self.cache:
+            self.cache[key] = len(np.unique(self.relations[pred][:, position])) if key[-1] else 0
+        return self.cache[key]
+
+    def has_delta(self, pred: Predicate) -> bool:
+        return self.boundaries[pred] < self.size(pred)
+
+    def rows(self, pred: Predicate, arity: int, part: str) -> tuple[np.ndarray, np.ndarray]:
+        relation = self.relations.get(pred, np.empty((0, arity), dtype=np.int64))
+        lower, upper = {'delta': (self.boundaries[pred], len(relation)),
+                        'old': (0, self.boundaries[pred]),
+                        'full': (0, len(relation))}[part]
+        return relation[lower:upper], np.arange(lower, upper)
+
+    def advance(self, inferred: dict[Predicate, list[np.ndarray]]):
+        for pred in self.relations:
+            self.boundaries[pred] = len(self.relations[pred])
+
+        for pred, chunks in inferred.items():
+            candidates = np.concatenate(chunks)
+            if (relation := self.relations.get(pred)) is not None:
+                known, keys = dense_keys(relation, candidates)
+                candidates = candidates[~np.isin(keys, known)]
+            # keeps the first occurrence of each row in the order of inference.
+            _, first = np.unique(dense_keys(candidates, candidates[:0])[0], return_index=True)
+            candidates = candidates[np.sort(first)]
+            if len(candidates):
+                self.relations[pred] = candidates if relation is None else np.concatenate([relation, candidates])
+                self.facts[pred].extend((pred, *row) for row in candidates.tolist())
+
+
+def evaluate(store: ColumnarStore, rule: Rule, pivot: Optional[int], order: tuple[int, ...]) -> tuple[np.ndarray, list[np.ndarray]]:
+    # returns the head rows and the matched row numbers of each body term.
+    rule_head, *rule_body = rule
+    columns: dict[Variable, np.ndarray] = {}
+    row_ids: dict[int, np.ndarray] = {}
+    size = 0
+
+    for depth, i in enumerate((pivot, *order) if pivot is not None else order):
+        pred, *args = rule_body[i]
+        rows, ids = store.rows(pred, len(args), 'full' if pivot is None else 'delta' if i == pivot else 'old' if i < pivot else 'full')
+
+        first_positions: dict[Variable, int] = {}
+        mask = np.ones(len(rows), dtype=bool)
+        for p, arg in enumerate(args):
+            if not isinstance(arg, Variable):
+                mask &= rows[:, p] == arg
+            elif arg in first_positions:
+                mask &= rows[:, p] == rows[:, first_positions[arg]]
+            else:
+                first_positions[arg] = p
+        rows, ids = rows[mask], ids[mask]
+
+        if depth == 0:
+            left_indices, right_indices = np.arange(len(rows)), np.arange(len(rows))
+        else:
+            shared = [arg for arg in first_positions if arg in columns]
+            left_keys, right_keys = dense_keys(stack([columns[arg] for arg in shared], size),
+                                               rows[:, [first_positions[arg] for arg in shared]])
+            left_indices, right_indices = join_indices(left_keys, right_keys)
+
+        columns = {arg: column[left_indices] for arg, column in columns.items()}
+        row_ids = {j: column[left_indices] for j, column in row_ids.items()}
+        for arg, p in first_positions.items():
+            if arg not in columns:
+                columns[arg] = rows[right_indices, p]
+        row_ids[i] = ids[right_indices]
+        if not (size := len(right_indices)):
+            return np.empty((0, len(rule_head) - 1), dtype=np.int64), []
+
+    head_pred, *head_args = rule_head
+    heads = stack([columns[arg] if isinstance(arg, Variable) else np.full(size, arg, dtype=np.int64)
+                   for arg in head_args], size)
+    return heads, [row_ids[i] for i in range(len(rule_body))]
+
+
+def process(rules: Iterable[Rule], facts: Iterable[Fact], explain: Optional[Callable[[str], Any]] = None,
+            progress: Optional[Callable[[str], Any]] = None) -> Iterable[Instance]:
+    # the same instances as algorithm.process(), joined set at a time.
+
+    store = ColumnarStore()
+    planner = Planner(store, explain)
+
+    grouped: dict[Predicate, list[list[Atom]]] = defaultdict(list)
+    for pred, *args in facts:
+        grouped[pred].append(args)
+    store.advance({pred: [np.array(rows, dtype=np.int64).reshape(len(rows), -1 if rows[0] else 0)] for pred, rows in grouped.items()})
+
+    strata = stratify(rules)
+    for number, stratum in enumerate(strata, 1):
+        joins: list[tuple[Rule, Optional[int]]] = [(rule, None) for rule in stratum]
+        iteration = 0
+        while results := [result
+                          for rule, pivot in joins
+                          if len((result := (rule, *evaluate(store, rule, pivot, planner.plan(rule, pivot))))[1])]:
+            instances: dict[Instance, None] = {} # in the order of the joins, each sorted like in saturate().
+            inferred: dict[Predicate, list[np.ndarray]] = defaultdict(list)
+            for rule, heads, row_ids in results:
+                (head_pred, *_), *rule_body = rule
+                inferred[head_pred].append(heads)
+                body_facts = [[store.facts[pred][row_id] for row_id in ids.tolist()] for (pred, *_), ids in zip(rule_body, row_ids)]
+                instances.update(dict.fromkeys(sorted(((head_pred, *head), *body) for head, *body in zip(heads.tolist(), *body_facts))))
+
+            store.advance(inferred)
+            report(progress, number, len(strata), iteration := iteration + 1, len(instances),
+                   sum(store.size(pred) - store.boundaries[pred] for pred in inferred))
+            yield from instances
+            joins = [(rule, pivot) for rule in stratum for pivot, (pred, *_) in enumerate(rule[1:]) if store.has_delta(pred)]
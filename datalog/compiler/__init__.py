@@ -1,14 +1,18 @@
-from typing import Any
-from xml.dom.minidom import Node
-from .grammar import compiler
+from typing import Any, Callable, Optional, Union
+from .builder import Element
+from .grammar import cached_compiler, compiler
 
 
 class ProgramVisitor:
-    def visit(self, node: Node, args: list[Any]):
-        if node.nodeType == Node.ELEMENT_NODE:
-            attrs = dict(node.attributes.items())
-            if handler := getattr(self, node.tagName.lower(), None):
-                return handler(attrs=attrs, children=args)
+    def __init__(self):
+        self.handlers: dict[str, Optional[Callable]] = {} # by the tags, looked up once each.
+
+    def visit(self, node: Union[Element, str], args: list[Any]):
+        if isinstance(node, Element):
+            if (handler := self.handlers.get(node.tag, False)) is False:
+                handler = self.handlers[node.tag] = getattr(self, node.tag.lower(), None)
+            if handler:
+                return handler(attrs=node.attrs, children=args)
         return args
 
 
@@ -16,11 +20,12 @@ class Interpreter:
     def __init__(self, visitor: ProgramVisitor):
         self.visitor = visitor
 
-    def interpret(self, node: Node):
+    def interpret(self, node: Union[Element, str]):
         args = []
-        for child in node.childNodes:
-            if (arg := self.interpret(child)) is not None:
-                args.append(arg)
+        if isinstance(node, Element):
+            for child in node.children:
+                if (arg := self.interpret(child)) is not None:
+                    args.append(arg)
 
         return self.visitor.visit(node, args)
 
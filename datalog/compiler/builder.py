@@ -1,9 +1,28 @@
 from abc import abstractmethod
 from typing import Any, Optional, Union
-from xml.dom.minidom import Document, Element
 from .parser import flatten
 
 
+class Element:
+    # a lighter node than the minidom Element it is converted into by to_dom().
+    __slots__ = ('tag', 'attrs', 'children')
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.attrs: dict[str, str] = {}
+        self.children: list[Union['Element', str]] = []
+
+    def to_dom(self, document = None):
+        from xml.dom.minidom import Document # only required for an XML dump.
+        document = document or Document()
+        e = document.createElement(self.tag)
+        for name, value in self.attrs.items():
+            e.setAttribute(name, value)
+        for child in self.children:
+            e.appendChild(document.createTextNode(child) if isinstance(child, str) else child.to_dom(document))
+        return e
+
+
 class Attribute:
     def __init__(self, name: str, value: str):
         self.name = name
@@ -18,7 +37,6 @@ MixedTree = Union[str, Element, 'Context', tuple[str, 'MixedTree'], list['MixedT
 
 class Context:
     def __init__(self, parent: Optional['Context'] = None, init: Optional[list[MixedTree]] = None):
-        self.document = Document() if not parent else parent.document
         self.parent = parent
         self.content = init or []
         self.dict = {'$$': self.content}
@@ -105,18 +123,16 @@ class ElementBuilder(Builder):
         return self
 
     def build(self, context: Context) -> Element:
-        e = context.document.createElement(tagName=self.tagName)
+        e = Element(self.tagName)
         for attr_builder in self.attrBuilders:
             name, value = attr_builder.build(context).unpack()
             if name:
                 assert isinstance(name, str) and isinstance(value, str)
-                e.setAttribute(name, value)
+                e.attrs[name] = value
 
         def append_child(child):
-            if isinstance(child, str):
-                e.appendChild(context.document.createTextNode(child))
-            elif isinstance(child, Element):
-                e.appendChild(child)
+            if isinstance(child, (str, Element)):
+                e.children.append(child)
             elif isinstance(child, list):
                 for sub_child in child:
                     append_child(sub_child)
@@ -1,8 +1,10 @@
 from abc import abstractmethod
+from functools import partial
+from operator import itemgetter
 import re
 from typing import Generic, Optional, TypeVar, Union
 
-from .parser import Result, TreeDesc, Parser, Stream, Layout, choice, sequence, start, eof
+from .parser import FAILED, Failure, Result, TreeDesc, Parser, Stream, Layout, packrat, choice, sequence, start, eof
 from .builder import Builder, Context, Attribute, Element
 
 
@@ -14,8 +16,8 @@ class ParserRef(Generic[T], Parser[T]):
         super().__init__()
         self.parser_ref = CompilerCompiler.make_ref(parser_name)
 
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        return self.parser_ref().parse(s, anchor)
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        return self.parser_ref().match(s, anchor)
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return self.parser_ref().describe(depth, stack)
@@ -30,8 +32,10 @@ class AtomicCompiler(Parser[Compiled]):
         self.parser = parser
         self.builder = builder
 
-    def parse(self, s: Stream, anchor: int) -> Result[Compiled]:
-        return self.builder.build(Context(init=self.parser.parse(s, anchor)))
+    def match(self, s: Stream, anchor: int) -> Union[Result[Compiled], Failure]:
+        if (parsed := self.parser.match(s, anchor)) is FAILED:
+            return FAILED
+        return self.builder.build(Context(init=parsed))
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return self.parser.describe(depth, stack)
@@ -47,9 +51,10 @@ class SpecializedCompiler(Generic[T], Parser[T]):
     def _type_check(self, s: Stream, result: Compiled):
         ...
 
-    def parse(self, s: Stream, anchor: int) -> T:
-        result = self.compiler.parse(s, anchor)
-        self._type_check(s, result)
+    @packrat
+    def match(self, s: Stream, anchor: int) -> Union[T, Failure]:
+        if (result := self.compiler.match(s, anchor)) is not FAILED:
+            self._type_check(s, result)
         return result
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -77,7 +82,7 @@ class ElementCompiler(SpecializedCompiler[Element]):
 
 class RootCompiler(SpecializedCompiler[Element]):
     def __init__(self, name: str, mappings: list[Parser[Compiled]]):
-        super().__init__(name, [sequence(start(), choice(*mappings), eof(), producer=lambda parsed: parsed[1])])
+        super().__init__(name, [sequence(start(), choice(*mappings), eof(), producer=itemgetter(1))])
 
     def _type_check(self, s: Stream, result: Compiled):
         assert isinstance(result, Element), f'ERROR: "{self.name}" is declared as element rule but it builds "{result}".'
@@ -105,7 +110,8 @@ class CompilerCompiler:
 
     @classmethod
     def make_ref(cls, name: str):
-        return (lambda compilers: (lambda: compilers.get(name)))(cls.compilers)
+        # bound to the registry of the grammar being compiled, and picklable along with the compiled parser.
+        return partial(cls.compilers.get, name)
 
     @classmethod
     def reset(cls) -> Optional[RootCompiler]:
@@ -1,6 +1,14 @@
+from glob import glob
+import hashlib
+from itertools import count
+import os
+import pickle
+import re
+import sys
+import tempfile
 from typing import Generic, Union, TypeVar
 from .parser import (
-    Stream, Result, Parser, TreeDesc, Token, Letter, Translator, Layout,
+    Failure, Stream, Result, Parser, TreeDesc, Token, Letter, Translator, Layout,
     gapless, sequence, choice, optional, zero_or_more, one_or_more, start, eof, _,
     flatten, take)
 from .builder import (
@@ -22,6 +30,13 @@ class SimpleString:
 
 
 class RexString:
+    # compiles /rex/ into one re.Pattern with atomic groups emulated by a lookahead and a backreference.
+
+    groups = count()
+
+    def atomic(rex: str) -> str:
+        name = f'_{next(RexString.groups)}'
+        return f'(?=(?P<{name}>{rex}))(?P={name})'
 
     def rex_element_builder(parsed):
         if len(parsed[1]) == 0:
@@ -29,43 +44,40 @@ class RexString:
         else:
             qualifier = ''.join(flatten(parsed[1]))
 
-            if qualifier == '?':
-                return optional(parsed[0])
-
-            if qualifier == '*':
-                return zero_or_more(parsed[0])
-
-            if qualifier == '+':
-                return one_or_more(parsed[0])
+            if qualifier in ('?', '*', '+'):
+                return RexString.atomic(f'(?:{parsed[0]}){qualifier}')
 
             raise ValueError(f"Unknown qualifier {qualifier} specified.")
 
-    escaped_char = gapless("\\", Letter("."), producer=lambda parsed: Token(parsed[1]))
-    secured_char = gapless(Letter("[^][)(|?*+/]"), producer=lambda parsed: Token(parsed[0]))
+    escaped_char = gapless("\\", Letter("."), producer=lambda parsed: re.escape(parsed[1]))
+    secured_char = gapless(Letter("[^][)(|?*+/]"), producer=lambda parsed: re.escape(parsed[0]))
 
     char_spec = one_or_more(choice(gapless("\\", Letter(".")), Letter("[^]]")))
-    char_class = gapless("[", choice(["^]", zero_or_more(char_spec)], [optional("^"), one_or_more(char_spec)]), "]", producer=lambda parsed: Letter(''.join(flatten(parsed))))
+    char_class = gapless("[", choice(["^]", zero_or_more(char_spec)], [optional("^"), one_or_more(char_spec)]), "]", producer=lambda parsed: ''.join(flatten(parsed)))
 
     rex_char = choice(escaped_char, secured_char, char_class)
 
     rex_pattern = gapless()
     rex_factor = choice(gapless('(', rex_pattern, ')', producer=lambda parsed: parsed[1]), rex_char)
     rex_element = gapless(rex_factor, optional(choice('?', '*', '+')), producer=rex_element_builder)
-    rex_sequence = gapless(one_or_more(rex_element), producer=lambda parsed: gapless(*flatten(parsed)))
-    rex_pattern.update(*_(rex_sequence, zero_or_more(gapless('|', rex_sequence))), producer=Translator(lambda parsed: choice(*flatten(parsed)[0::2])))
+    rex_sequence = gapless(one_or_more(rex_element), producer=lambda parsed: ''.join(flatten(parsed)))
+    rex_pattern.update(*_(rex_sequence, zero_or_more(gapless('|', rex_sequence))),
+                       producer=Translator(lambda parsed: r[0] if 1 == len(r := flatten(parsed)[0::2]) else RexString.atomic('|'.join(r))))
 
     class Parser(Generic[T], Parser[T]):
-        def __init__(self, parser: Parser[T]):
+        def __init__(self, pattern: re.Pattern):
             super().__init__()
-            self.parser = parser
+            self.pattern = pattern
 
-        def parse(self, s: Stream, anchor: int) -> Result[T]:
-            return ''.join(flatten(self.parser.parse(s, anchor)))
+        def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+            if (matched := s.scan(self.pattern)) is None:
+                return s.fail(f"Rex mismatch '{self.pattern.pattern}'")
+            return matched
 
         def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
-            return self.parser.describe(depth, stack)
+            return "Rex", self.pattern
 
-    rex_string = gapless('/', rex_pattern, '/', producer=lambda parsed: RexString.Parser(parsed[1]))
+    rex_string = gapless('/', rex_pattern, '/', producer=lambda parsed: RexString.Parser(re.compile(parsed[1])))
 
 
 class Head:
@@ -205,8 +217,38 @@ class Main:
 
 
 def compiler(grammar: str) -> Parser[Compiled]:
-    CompilerCompiler.reset()
-    Main.grammar(grammar)
-    return CompilerCompiler.reset()
+    # the registry is left empty whether the grammar compiles or not.
+    try:
+        CompilerCompiler.reset()
+        Main.grammar(grammar)
+        return CompilerCompiler.root
+    finally:
+        CompilerCompiler.reset()
+
+
+def cached_compiler(grammar: str, cache_dir: str) -> Parser[Compiled]:
+    # compiler() with the parser cached on disk, keyed by the grammar, the package sources and the Python version.
+    digest = hashlib.sha256(f'{sys.version_info[:2]}\n{grammar}'.encode('utf-8'))
+    for source in sorted(glob(os.path.dirname(__file__) + '/**/*.py', recursive=True)):
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+    path = os.path.join(cache_dir, f'grammar-{digest.hexdigest()[:16]}.pickle')
+
+    try:
+        with open(path, 'rb') as cached:
+            return pickle.load(cached)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        pass
+
+    compiled = compiler(grammar)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written aside and then renamed, so that concurrent runs never load a partial file.
+        with tempfile.NamedTemporaryFile('wb', dir=cache_dir, delete=False) as f:
+            pickle.dump(compiled, f)
+        os.replace(f.name, path)
+    except OSError:
+        pass
+    return compiled
 
 
@@ -1,8 +1,8 @@
 from typing import Callable, Generic, TypeVar
 from .parser import (
-    Producer, Result, TreeDesc, ParsingFailed,
+    Producer, Result, TreeDesc, ParsingFailed, packrat,
     Parser, Token, Letter, Optional, ZeroOrMore, OneOrMore, AndPredicate, NotPredicate, Choice, Sequence, Start, End)
-from .stream import Stream
+from .stream import FAILED, Failure, Stream
 
 
 T = TypeVar('T')
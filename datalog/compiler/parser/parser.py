@@ -1,9 +1,10 @@
 from abc import abstractmethod
 from enum import Enum
+from functools import wraps
 import re
 from typing import Generic, Optional, TypeVar, Union
 
-from .stream import AssumedError, Stream
+from .stream import FAILED, AssumedError, Failure, Stream
 
 
 class ParsingFailed(AssumedError):
@@ -15,10 +16,42 @@ Result = Union[str, T, tuple[str, 'Result'], list['Result']]
 TreeDesc = tuple[str, Union[str, list['TreeDesc']]]
 
 
+def packrat(match):
+    # memoizes the outcomes of a parser on a stream in the packrat mode by the position and the anchor, failures as well,
+    # so that it never runs twice at the same place however much the grammar backtracks. It pays for the named rules,
+    # which the alternatives of a grammar share, rather than for every anonymous sequence or choice.
+    @wraps(match)
+    def memoized(self, s: Stream, anchor: int):
+        if s.memo is None:
+            return match(self, s, anchor)
+
+        key = (id(self), s.pos, anchor)
+        if (outcome := s.memo.get(key)) is None:
+            outcome = s.memo[key] = (match(self, s, anchor), s.pos, s.shift)
+
+        result, pos, shift = outcome
+        s.jump(pos, shift)
+        return result
+
+    return memoized
+
+
 class Parser(Generic[T]):
-    @abstractmethod
+    # match() returns FAILED and leaves the stream as it was; parse() raises. a subclass overrides at least one.
+
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        if type(self).parse is Parser.parse:
+            raise NotImplementedError(f"{type(self).__name__} overrides neither match() nor parse()")
+        try:
+            return self.parse(s, anchor)
+        except ParsingFailed as e:
+            return s.fail(str(e), e.pos, e.shift)
+
     def parse(self, s: Stream, anchor: int) -> Result[T]:
-        ...
+        if (result := self.match(s, anchor)) is FAILED:
+            pos, shift, message = s.failure
+            raise ParsingFailed(s, message, pos, shift)
+        return result
 
     def describe(self, depth: int = 0, stack: Optional[set['Parser']] = None) -> TreeDesc:
         if stack is None:
@@ -36,12 +69,12 @@ class Parser(Generic[T]):
     def _describe(self, depth: int, stack: set['Parser']) -> TreeDesc:
         ...
 
-    def __call__(self, text: str):
-        return self.parse(Stream(text), 0)
+    def __call__(self, text: str, packrat: bool = False):
+        return self.parse(Stream(text, packrat), 0)
 
 
 class Empty(Generic[T], Parser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Result[T]:
         return []
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -49,9 +82,9 @@ class Empty(Generic[T], Parser[T]):
 
 
 class Start(Generic[T], Parser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
         if s.pos:
-            raise ParsingFailed(s, 'Start unsatisfied')
+            return s.fail('Start unsatisfied')
         return []
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -59,9 +92,9 @@ class Start(Generic[T], Parser[T]):
 
 
 class End(Generic[T], Parser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
         if not s.at_end():
-            raise ParsingFailed(s, 'End unsatisfied')
+            return s.fail('End unsatisfied')
         return []
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -77,12 +110,14 @@ class Token(Generic[T], Terminal[T]):
         super().__init__()
         self.token = token
 
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        with s:
-            for c in self.token:
-                if (ch := s.next()) != c:
-                    raise ParsingFailed(s, f"Token mismatch '{self.token}' with {ch}")
-            return self.token
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        pos, shift = s.pos, s.shift
+        for c in self.token:
+            if (ch := s.next()) != c:
+                s.fail(f"Token mismatch '{self.token}' with {ch}")
+                s.jump(pos, shift)
+                return FAILED
+        return self.token
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return "Token", self.token
@@ -93,11 +128,13 @@ class Letter(Generic[T], Terminal[T]):
         super().__init__()
         self.rex = re.compile(rex)
 
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        with s:
-            if not self.rex.match(ch := s.next()):
-                raise ParsingFailed(s, f"Letter mismatch '{ch}' != '{self.rex}'")
-            return ch
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        pos, shift = s.pos, s.shift
+        if not self.rex.match(ch := s.next()):
+            s.fail(f"Letter mismatch '{ch}' != '{self.rex}'")
+            s.jump(pos, shift)
+            return FAILED
+        return ch
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return "Letter", self.rex
@@ -110,24 +147,18 @@ class QualifiedParser(Generic[T], Parser[T]):
 
 
 class Optional(Generic[T], QualifiedParser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        try:
-            return self.content.parse(s, anchor)
-        except ParsingFailed as e:
-            return []
+    def match(self, s: Stream, anchor: int) -> Result[T]:
+        return [] if (result := self.content.match(s, anchor)) is FAILED else result
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return "Optional", [self.content.describe(depth + 1, stack)]
 
 
 class ZeroOrMore(Generic[T], QualifiedParser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Result[T]:
         result = []
-        while not s.at_end():
-            try:
-                result.append(self.content.parse(s, anchor))
-            except ParsingFailed as e:
-                break
+        while not s.at_end() and (parsed := self.content.match(s, anchor)) is not FAILED:
+            result.append(parsed)
         return result
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -135,10 +166,10 @@ class ZeroOrMore(Generic[T], QualifiedParser[T]):
 
 
 class OneOrMore(Generic[T], ZeroOrMore[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        result = super().parse(s, anchor)
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        result = super().match(s, anchor)
         if len(result) == 0:
-            raise ParsingFailed(s, 'OneOrMore unsatisfied')
+            return s.fail('OneOrMore unsatisfied')
         return result
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
@@ -146,25 +177,25 @@ class OneOrMore(Generic[T], ZeroOrMore[T]):
 
 
 class AndPredicate(Generic[T], QualifiedParser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        with s:
-            self.content.parse(s, anchor)
-            s.rewind()
-            return []
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        pos, shift = s.pos, s.shift
+        if self.content.match(s, anchor) is FAILED:
+            return FAILED
+        s.jump(pos, shift)
+        return []
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return "AndPredicate", [self.content.describe(depth + 1, stack)]
 
 
 class NotPredicate(Generic[T], QualifiedParser[T]):
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
-        with s:
-            try:
-                self.content.parse(s, anchor)
-            except ParsingFailed as e:
-                s.rewind()
-                return []
-            raise ParsingFailed(s, 'NotPredicate unsatisfied.')
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        pos, shift = s.pos, s.shift
+        if self.content.match(s, anchor) is FAILED:
+            return []
+        s.fail('NotPredicate unsatisfied.')
+        s.jump(pos, shift)
+        return FAILED
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
         return "NotPredicate", [self.content.describe(depth + 1, stack)]
@@ -175,14 +206,11 @@ class Choice(Generic[T], Parser[T]):
         super().__init__()
         self.choices = choices
 
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
         for choice in self.choices:
-            try:
-                return choice.parse(s, anchor)
-            except ParsingFailed as e:
-                pass
-        else:
-            raise ParsingFailed(s, "Choice mismatch")
+            if (result := choice.match(s, anchor)) is not FAILED:
+                return result
+        return s.fail("Choice mismatch")
 
     def update(self, *choices: Parser):
         self.choices = choices
@@ -229,16 +257,16 @@ class Sequence(Generic[T], Parser[T]):
                         s.stepback()
                         return
 
-        def adjust(self, s: Stream, anchor: int):
+        def adjust(self, s: Stream, anchor: int) -> Union[int, Failure]:
 
             if self == self.indent:
                 if s.shift <= anchor:
-                    raise ParsingFailed(s, 'Not indented.')
+                    return s.fail('Not indented.')
                 return s.shift
 
             if self == self.keep:
                 if anchor != s.shift:
-                    raise ParsingFailed(s, 'Not the indentation kept.')
+                    return s.fail('Not the indentation kept.')
                 return s.shift
 
             return anchor
@@ -253,13 +281,15 @@ class Sequence(Generic[T], Parser[T]):
         self.children = children or self.children
         return self
 
-    def parse(self, s: Stream, anchor: int) -> Result[T]:
+    def match(self, s: Stream, anchor: int) -> Union[Result[T], Failure]:
+        pos, shift = s.pos, s.shift
         result = []
-        with s:
-            for child, layout, tag in self.children:
-                layout.skip_air(s)
-                parsed = child.parse(s, layout.adjust(s, anchor))
-                result.append((tag, parsed) if tag else parsed)
+        for child, layout, tag in self.children:
+            layout.skip_air(s)
+            if (adjusted := layout.adjust(s, anchor)) is FAILED or (parsed := child.match(s, adjusted)) is FAILED:
+                s.jump(pos, shift)
+                return FAILED
+            result.append((tag, parsed) if tag else parsed)
         return self.producer.produce(result)
 
     def _describe(self, depth: int, stack: set[Parser]) -> TreeDesc:
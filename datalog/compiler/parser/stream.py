@@ -1,22 +1,37 @@
+import re
+from typing import Optional
 
 
 class AssumedError(Exception):
-    def __init__(self, stream: 'Stream', message: str):
+    def __init__(self, stream: 'Stream', message: str, pos: Optional[int] = None, shift: Optional[int] = None):
         super().__init__(message)
-        self.pos = stream.pos
-        self.shift = stream.shift
+        self.pos = stream.pos if pos is None else pos
+        self.shift = stream.shift if shift is None else shift
+
+
+class Failure:
+    def __repr__(self):
+        return "FAILED"
+
+
+FAILED = Failure()
 
 
 class Stream:
-    def __init__(self, data: str):
+    def __init__(self, data: str, packrat: bool = False):
         self._data: str = data.replace("\r\n", "\n").replace("\r", "\n")
 
+        # the outcomes of the parsers by (parser id, position, anchor), only in the packrat mode.
+        self.memo: Optional[dict[tuple[int, int, int], tuple]] = {} if packrat else None
+
         self._pos: int = 0
-        self._pos_stack: list[tuple[int, int]] = []
 
         self._shift: int = 0
         self._prev_letter: str = ""
 
+        # the farthest failure as (position, shift, message), which a failed parse is reported with.
+        self.failure: tuple[int, int, str] = (-1, 0, "")
+
     @property
     def pos(self) -> int:
         return self._pos
@@ -41,31 +56,26 @@ class Stream:
                 self._shift += 1
             return letter
 
-    def stepback(self):
-        assert self.pos > 0
-        self._pos -= 1
-
-    def save(self):
-        self._pos_stack.append((self.pos, self.shift))
-
-    def restore(self):
-        self._pos, self._shift = self._pos_stack.pop()
-
-    def commit(self):
-        self._pos_stack.pop()
+    def scan(self, pattern: re.Pattern) -> Optional[str]:
+        # matches the pattern on the data at the position in one go, moving past what it matches as next() would.
+        if matched := pattern.match(self._data, self._pos):
+            self._pos = matched.end()
+            self._shift += len(text := matched.group())
+            return text
+        return None
 
-    def rewind(self):
-        self.restore()
-        self.save()
+    def fail(self, message: str, pos: Optional[int] = None, shift: Optional[int] = None) -> Failure:
+        if pos is None:
+            pos, shift = self._pos, self._shift
+        if pos >= self.failure[0]:
+            self.failure = (pos, shift, message)
+        return FAILED
 
-    def __enter__(self):
-        self.save()
-        return self
+    def jump(self, pos: int, shift: int):
+        self._pos, self._shift = pos, shift
 
-    def __exit__(self, exc_type, exc_value, trace):
-        if isinstance(exc_value, AssumedError):
-            self.restore()
-        else:
-            self.commit()
+    def stepback(self):
+        assert self.pos > 0
+        self._pos -= 1
 
 
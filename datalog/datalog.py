@@ -1,52 +1,137 @@
+import argparse
 import os
 import sys
-from typing import cast
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from contextlib import nullcontext
+from typing import Any, BinaryIO, Callable, Optional
 
-from compiler import Interpreter, ProgramVisitor, compiler
+from agformat import HEADER, MAGIC, VERSION
+from compiler import Element, Interpreter, ProgramVisitor, cached_compiler
 from compiler.parser import ParsingFailed
 
-from algorithm import process, Atom, Variable, Fact, Term, Predicate, Argument
+from algorithm import process as process_tuples, query, symbols, Session, Atom, Variable, Fact, Term, Predicate, Argument, Rule, Instance
 
 
 class DatalogProcessor:
     def __init__(self):
         self.facts = set()
-        self.rules = set()
+        self.rules: dict[Rule, None] = {} # an ordered set, so that the rules are evaluated in the order of the source.
         self.aggregations = {}
+        self.session: Optional[Session] = None
+        self.sources: Counter[Fact] = Counter() # the number of facts behind each aggregated one, during a session.
 
     def create_atom(self, name: str) -> Atom:
-        return cast(Atom, name)
+        return symbols.intern(name)
 
     def create_variable(self, name: str) -> Variable:
         return Variable(name=name)
 
     def create_term(self, predicate: str, args: list[Argument]) -> Term:
-        return (predicate, *args)
+        return (symbols.intern(predicate), *args)
 
     def register_fact(self, predicate: str, args: list[Atom]):
-        self.facts.add((predicate, *args))
+        self.facts.add((symbols.intern(predicate), *args))
 
     def register_rule(self, head: Term, body: list[Term]):
         head_pred, *head_body = head
         head_variables = {arg for arg in head_body if isinstance(arg, Variable)}
         body_variables = {arg for _, *term_body in body for arg in term_body if isinstance(arg, Variable)}
         assert head_variables.issubset(body_variables)
-        self.rules.add((head, *body))
+        self.rules[(head, *body)] = None
 
-    def register_aggregation(self, lhs: Atom, rhs: list[Atom]):
+    def register_aggregation(self, lhs: str, rhs: list[Atom]):
         for atom in rhs:
             assert atom not in self.aggregations
-            self.aggregations[atom] = lhs
+            self.aggregations[atom] = symbols.intern(lhs)
 
-    def process(self):
+    def aggregate(self, fact: Fact) -> Fact:
+        pred, *args = fact
+        return (pred, *(self.aggregations.get(arg, arg) for arg in args))
+
+    def aggregated(self) -> tuple[set[Rule], set[Fact]]:
         rules = self.rules
         facts = self.facts
         if self.aggregations:
-            rules = {tuple((pred, *(self.aggregations.get(arg, arg) for arg in args)) for pred, *args in rule)
-                     for rule in rules}
-            facts = {(pred, *(self.aggregations.get(arg, arg) for arg in args)) for pred, *args in facts}
+            rules = dict.fromkeys(tuple(map(self.aggregate, rule)) for rule in rules)
+            facts = set(map(self.aggregate, facts))
+        return rules, facts
+
+    def restore(self, instances: Iterable[Instance]) -> list[tuple[tuple[str, ...], ...]]:
+        return list(self.restore_lazily(instances))
+
+    def restore_lazily(self, instances: Iterable[Instance]) -> Iterable[tuple[tuple[str, ...], ...]]:
+        # the names are restored only here, as the instances pass, keeping nothing of them.
+        for instance in instances:
+            yield tuple(map(symbols.restore, instance))
+
+    def process(self, explain: Optional[Callable[[str], Any]] = None, mode: str = 'tuple', workers: Optional[int] = None,
+                progress: Optional[Callable[[str], Any]] = None) -> Iterable[tuple[tuple[str, ...], ...]]:
+        # the instances with their names restored.
+        return self.restore_lazily(self.evaluate(explain, mode, workers, progress))
+
+    def evaluate(self, explain: Optional[Callable[[str], Any]] = None, mode: str = 'tuple', workers: Optional[int] = None,
+                 progress: Optional[Callable[[str], Any]] = None) -> Iterable[Instance]:
+        # like process(), the instances being left as the IDs of their symbols.
+        rules, facts = self.aggregated()
+        if mode == 'columnar':
+            from columnar import process as process_columnar # NumPy is required only in this mode.
+            return process_columnar(rules, facts, explain, progress)
+        if mode == 'parallel':
+            from parallel import process as process_parallel
+            return process_parallel(rules, facts, explain, workers, progress)
+        return process_tuples(rules, facts, explain, progress)
 
-        return list(process(rules, facts))
+    def query(self, goals: Iterable[tuple[Optional[str], ...]], explain: Optional[Callable[[str], Any]] = None):
+        # only the instances relevant to the goals; a None argument is free.
+        rules, facts = self.aggregated()
+        goals = [(symbols.intern(pred), *(None if arg is None else self.aggregations.get(atom := symbols.intern(arg), atom) for arg in args))
+                 for pred, *args in goals]
+        arities = {head[0]: len(head) - 1 for head, *_ in rules}
+        for pred, *args in goals:
+            if pred not in arities:
+                raise ValueError(f"{symbols[pred]} is derived by no rule")
+            if args and len(args) != arities[pred]:
+                raise ValueError(f"{symbols[pred]} takes {arities[pred]} arguments, not {len(args)}")
+        return self.restore(query(rules, facts, goals, explain))
+
+    def start_session(self, explain: Optional[Callable[[str], Any]] = None):
+        # the current program materialized for assert_facts() and retract_facts().
+        rules, facts = self.aggregated()
+        self.session = Session(rules, facts, explain)
+        self.sources = Counter(map(self.aggregate, self.facts))
+        return self.restore(self.session.instances)
+
+    def intern_facts(self, facts: Iterable[tuple[str, ...]]) -> list[Fact]:
+        return [(symbols.intern(pred), *map(symbols.intern, args)) for pred, *args in facts]
+
+    def assert_facts(self, facts: Iterable[tuple[str, ...]]):
+        # returns the instances added and removed.
+        facts = self.intern_facts(facts)
+        if self.session is None:
+            self.start_session()
+        for fact in facts:
+            if fact not in self.facts:
+                self.facts.add(fact)
+                self.sources[self.aggregate(fact)] += 1
+        added, removed = self.session.insert(map(self.aggregate, facts))
+        return self.restore(added), self.restore(removed)
+
+    def retract_facts(self, facts: Iterable[tuple[str, ...]]):
+        # returns the instances added and removed; an aggregated fact goes with the last fact aggregated into it.
+        facts = self.intern_facts(facts)
+        if self.session is None:
+            self.start_session()
+        retracted = []
+        for fact in facts:
+            if fact in self.facts:
+                self.facts.remove(fact)
+                if not (remaining := self.sources[aggregated := self.aggregate(fact)] - 1):
+                    retracted.append(aggregated)
+                self.sources[aggregated] = remaining
+        added, removed = self.session.delete(retracted)
+        return self.restore(added), self.restore(removed)
 
 
 class DatalogProgramVisitor(ProgramVisitor):
@@ -77,27 +162,99 @@ class DatalogProgramVisitor(ProgramVisitor):
         self.processor.register_aggregation(attrs['to'], children)
 
 
+class InstanceWriter:
+    # writes the instances as they come, restoring the names of their facts in close().
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.strings: dict[Atom, int] = {} # the string IDs by the symbols.
+        self.facts: dict[Fact, int] = {}
+        self.instance_words = 0
+        self.file.write(bytes(HEADER.size)) # filled in by close().
+
+    def fact_id(self, fact: Fact) -> int:
+        if (fact_id := self.facts.get(fact)) is None:
+            fact_id = self.facts[fact] = len(self.facts)
+            for symbol in fact:
+                self.strings.setdefault(symbol, len(self.strings))
+        return fact_id
+
+    def write(self, instance: Instance):
+        self.write_words([len(instance), *map(self.fact_id, instance)])
+        self.instance_words += len(instance) + 1
+
+    def write_words(self, words: Iterable[int]):
+        words = array('I', words)
+        if sys.byteorder == 'big':
+            words.byteswap()
+        self.file.write(words.tobytes())
+
+    def close(self):
+        fact_offsets = [0]
+        for fact in self.facts:
+            fact_offsets.append(fact_offsets[-1] + len(fact))
+        self.write_words(fact_offsets)
+        self.write_words(self.strings[symbol] for fact in self.facts for symbol in fact)
+
+        encoded = [symbols[symbol].encode('utf-8') for symbol in self.strings]
+        string_offsets = [0]
+        for name in encoded:
+            string_offsets.append(string_offsets[-1] + len(name))
+        self.write_words(string_offsets)
+        self.file.write(b''.join(encoded) + bytes(-string_offsets[-1] % 4))
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.instance_words, len(self.facts), fact_offsets[-1], len(self.strings), string_offsets[-1]))
+
+
 app_dir = os.path.dirname(__file__)
 
 with open(app_dir + '/datalog.g') as grammar:
-    datalog_compiler = compiler(grammar.read())
+    datalog_compiler = cached_compiler(grammar.read(), os.path.join(app_dir, '__pycache__'))
 
-if len(sys.argv) < 2:
-    print('arguments missing')
-    exit(1)
 
-with open(sys.argv[1], encoding='utf-8') as program:
-    compiled = datalog_compiler(program.read())
+def load_program(program: str) -> tuple[DatalogProcessor, Element]:
+    compiled = datalog_compiler(program, packrat=True)
     processor = DatalogProcessor()
     Interpreter(DatalogProgramVisitor(processor)).interpret(compiled)
+    return processor, compiled
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('program', help='the datalog program (*.d) to process.')
+    argparser.add_argument('--explain', action='store_true', help='print the join order chosen for each rule to stderr.')
+    argparser.add_argument('--mode', choices=('tuple', 'columnar', 'parallel'), default='tuple',
+                           help='evaluate the rules tuple at a time, set at a time over NumPy columns, or tuple at a time on a process pool.')
+    argparser.add_argument('--xml', action='store_true', help='also write the parse tree of the program as XML (*.xml).')
+    argparser.add_argument('--python', action='store_true', help='also write the instances as a Python list literal (*.py) for debugging.')
+    argparser.add_argument('--progress', action='store_true', help='report the number of instances of every fixpoint iteration to stderr.')
+    argparser.add_argument('--workers', type=int, help='the number of worker processes in the parallel mode (default: the number of CPUs).')
+    args = argparser.parse_args()
 
-    with open(os.path.splitext(sys.argv[1])[0] + '.xml', 'w', encoding='utf-8') as parsed_xml:
-        parsed_xml.write(compiled.toprettyxml())
+    with open(args.program, encoding='utf-8') as program:
+        processor, compiled = load_program(program.read())
 
-    with open(os.path.splitext(sys.argv[1])[0] + '.py', 'w', encoding='utf-8') as data_py:
-        data_py.write("[\n")
-        for instance in processor.process():
-            data_py.write(f"    {instance},\n")
-        data_py.write("]\n")
+        if args.xml:
+            with open(os.path.splitext(args.program)[0] + '.xml', 'w', encoding='utf-8') as parsed_xml:
+                parsed_xml.write(compiled.to_dom().toprettyxml())
 
+        with open(os.path.splitext(args.program)[0] + '.ag', 'wb') as data_ag, \
+                open(os.path.splitext(args.program)[0] + '.py', 'w', encoding='utf-8') if args.python else nullcontext() as data_py:
+            def report(message: str):
+                # whatever has been derived so far is on disk by the time an iteration is reported.
+                data_ag.flush()
+                print(message, file=sys.stderr, flush=True)
 
+            # the instances are written as they are derived, so that only one iteration of them is held at a time.
+            writer = InstanceWriter(data_ag)
+            if data_py:
+                data_py.write("[\n")
+            for instance in processor.evaluate(explain=(lambda plan: print(plan, file=sys.stderr)) if args.explain else None, mode=args.mode,
+                                               workers=args.workers, progress=report if args.progress else None):
+                writer.write(instance)
+                if data_py:
+                    data_py.write(f"    {tuple(map(symbols.restore, instance))},\n")
+            writer.close()
+            if data_py:
+                data_py.write("]\n")
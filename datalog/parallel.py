@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional
+
+from algorithm import Fact, FactStore, Instance, Planner, Predicate, Rule, compile_join, report, stratify, symbols
+
+Task = tuple[int, Optional[int], tuple[int, ...]] # the index of a rule, its delta pivot and its plan.
+
+# the state of each worker process.
+replica_rules: list[Rule] = []
+replica: Optional[FactStore] = None
+barrier = None
+
+
+def initialize(rules: list[Rule], facts: list[Fact], names: list[str], shared_barrier):
+    global replica_rules, replica, barrier
+    # a worker started by spawn or forkserver has no names of its own, which the joins are compiled with.
+    symbols.names = names
+    symbols.ids = {name: symbol for symbol, name in enumerate(names)}
+    replica_rules = rules
+    replica = FactStore(facts)
+    barrier = shared_barrier
+
+
+def evaluate(added: list[Fact], tasks: list[Task]) -> list[list[Instance]]:
+    # Every worker takes exactly one task a round, so its replica sees every batch of added facts exactly once.
+    # A worker failing breaks the barrier, so that the others do not wait for it forever.
+    try:
+        barrier.wait()
+        delta: dict[Predicate, set[Fact]] = defaultdict(set)
+        for fact in added:
+            if replica.add(fact):
+                delta[fact[0]].add(fact)
+        return [sorted(compile_join(replica_rules[index], pivot, order)(replica, delta)) for index, pivot, order in tasks]
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+def partition(weights: list[int], workers: int) -> list[list[int]]:
+    # Longest processing time first: the heaviest task goes to the least loaded worker, the tasks given by their positions.
+    partitions: list[list[int]] = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for position in sorted(range(len(weights)), key=lambda position: -weights[position]):
+        partitions[lightest := loads.index(min(loads))].append(position)
+        loads[lightest] += weights[position]
+    return partitions
+
+
+def process(rules: Iterable[Rule], facts: Iterable[Fact], explain: Optional[Callable[[str], Any]] = None,
+            workers: Optional[int] = None, progress: Optional[Callable[[str], Any]] = None) -> Iterable[Instance]:
+    # algorithm.process() with the joins of every iteration spread over a process pool.
+    rules, facts = list(rules), list(facts)
+    workers = workers or os.cpu_count() or 1
+    store = FactStore(facts)
+    planner = Planner(store, explain)
+    indices = {rule: index for index, rule in enumerate(rules)}
+
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(workers)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=initialize,
+                             initargs=(rules, facts, symbols.names, barrier)) as executor:
+        try:
+            added: list[Fact] = []
+            strata = stratify(rules)
+            for number, stratum in enumerate(strata, 1):
+                joins: list[tuple[Rule, Optional[int]]] = [(rule, None) for rule in stratum]
+                delta: dict[Predicate, set[Fact]] = {}
+                iteration = 0
+                while joins:
+                    tasks = [(indices[rule], pivot, planner.plan(rule, pivot)) for rule, pivot in joins]
+                    weights = [len(delta[rule[pivot + 1][0]]) if pivot is not None else min(store.size(pred) for pred, *_ in rule[1:])
+                               for rule, pivot in joins]
+                    partitions = partition(weights, workers)
+                    futures = {executor.submit(evaluate, added, [tasks[position] for position in positions]): positions
+                               for positions in partitions}
+                    added = []
+                    # collected as they complete, so that a failure is seen at once, and merged in the order of the joins,
+                    # so that the instances and the store are exactly those of the serial evaluation.
+                    results: list[list[Instance]] = [[] for _ in joins]
+                    for future in as_completed(futures):
+                        for position, joined in zip(futures[future], future.result()):
+                            results[position] = joined
+                    if not (instances := dict.fromkeys(instance for joined in results for instance in joined)):
+                        break
+
+                    delta = defaultdict(set)
+                    for inferred_fact, *_ in instances:
+                        if store.add(inferred_fact):
+                            delta[inferred_fact[0]].add(inferred_fact)
+                            added.append(inferred_fact)
+                    report(progress, number, len(strata), iteration := iteration + 1, len(instances), len(added))
+                    yield from instances
+                    joins = [(rule, pivot) for rule in stratum for pivot, (pred, *_) in enumerate(rule[1:]) if pred in delta]
+        except BrokenProcessPool:
+            # the workers are terminated already, possibly holding the lock of the barrier.
+            raise
+        except BaseException:
+            # the workers waiting for one that has failed are released, so that the pool can shut down.
+            barrier.abort()
+            raise
@@ -7,7 +7,7 @@ if len(sys.argv) < 2:
     exit(1)
 
 
-ag = load_attack_graph(sys.argv[1])
+ag = load_attack_graph(sys.argv[1], compact=True)
 
 
 with open(os.path.splitext(sys.argv[1])[0] + '.dot', 'w', encoding='utf-8') as graph:
@@ -1,9 +1,50 @@
+from array import array
+import ast
 from collections import defaultdict
-import hashlib
+import mmap
 import os
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(__file__), 'datalog'))
+from agformat import HEADER, MAGIC, VERSION
+from bdd import compile_cut_sets
 
-class AttackGraph:
+
+class GraphQueries:
+    # the queries shared by both attack graphs, defined on sources(node).
+
+    def get_formula(self, goals, control_targets):
+        # 経路表現式への変換(DAG化と同時に行う)
+        formula, root = self.get_formula_dag(goals, control_targets)
+        return formula.expand(root)
+
+    def get_formula_dag(self, goals, control_targets, founded=False, any_goal=False):
+        # the initial conditions of the control targets are the only ones left in the formula; see build_formula().
+        assert 1 <= len(goals)
+        uncontrollable_conditions = {c for c in self.initial_conditions if c[0] not in control_targets}
+        uncontrollable_conditions.add(('noProtection', 'the_internet'))
+        return build_formula(goals, self.sources, uncontrollable_conditions, founded, any_goal)
+
+    def get_cut_sets(self, goals, control_targets, any_goal=False):
+        # the minimal sets of controllable conditions leading to the goals, as a ZDD and its root; see bdd.py.
+        return compile_cut_sets(*self.get_formula_dag(goals, control_targets, founded=True, any_goal=any_goal))
+
+    def to_dot(self) -> str:
+        app_dir = os.path.dirname(__file__)
+        with open(app_dir + '/graph_template.dot', 'r') as fp:
+            template = fp.read()
+
+        def node_to_label(node):
+            return node if isinstance(node, str) else fact_to_label(node)
+
+        sep = '_'
+        # sorted, so that the same graph is written the same way whatever the hashes of the strings.
+        node_defs = sorted(f'"{node_to_label(condition)}" [shape=rect, style="rounded"];' for condition in self.conditions) + sorted(f'"{exploit}" [shape=box];' for exploit in self.exploits)
+        edge_defs = sorted(f'"{node_to_label(src)}" -> "{node_to_label(dst)}";' for src, dst in self.edges)
+        return template.replace('%Nodes%', '\n  '.join(node_defs)).replace('%Edges%', '\n  '.join(edge_defs))
+
+
+class AttackGraph(GraphQueries):
     @classmethod
     def from_instances(cls, instances):
         conditions = set()
@@ -12,13 +53,13 @@ class AttackGraph:
         for instance in instances:
             head, *body = instance
             conditions.add(head)
-            exploit = hashlib.blake2b(str(instance).encode('utf-8')).hexdigest()
-            if exploit not in exploits:
-                exploits[exploit] = f"e{len(exploits) + 1}"
+            # an exploit is identified by its instance itself, and labeled in the order of first appearance.
+            if (exploit := exploits.get(instance)) is None:
+                exploit = exploits[instance] = f"e{len(exploits) + 1}"
             for fact in body:
                 conditions.add(fact)
-                edges.add((fact, exploits[exploit]))
-            edges.add((exploits[exploit], head))
+                edges.add((fact, exploit))
+            edges.add((exploit, head))
 
         return cls(conditions, set(exploits.values()), edges)
 
@@ -33,101 +74,408 @@ class AttackGraph:
             self.dst_to_src[dst].add(src)
             self.src_to_dst[src].add(dst)
 
+        # built once here, as every subgraph is a new AttackGraph.
+        self.conditions_by_pred = defaultdict(set)
+        for condition in conditions:
+            self.conditions_by_pred[condition[0]].add(condition)
+        self._initial_conditions = frozenset(condition for condition in conditions if not self.dst_to_src.get(condition))
+
     @property
     def initial_conditions(self):
-        return self.conditions - {dst for src, dst in self.edges}
+        return self._initial_conditions
 
     def filter_facts_with_pred(self, *preds):
-        goals = set()
-        for condition in self.conditions:
-            pred, *_ = condition
-            if pred in preds:
-                goals.add(condition)
-        return goals
+        return set().union(*(self.conditions_by_pred.get(pred, ()) for pred in preds))
+
+    def trace(self, seeds):
+        # backward reachability from all the seeds at once, each node collecting the bits of the seeds it reaches.
+        contributions = {}
+        stack = []
+        for goal, bits in seeds:
+            contributions[goal] = contributions.get(goal, 0) | bits
+            stack.append(goal)
+        while stack:
+            bits = contributions[node := stack.pop()]
+            for src in self.dst_to_src.get(node, ()):
+                if bits & ~contributions.get(src, 0):
+                    contributions[src] = contributions.get(src, 0) | bits
+                    stack.append(src)
+        return contributions
+
+    def subgraph(self, nodes):
+        # the nodes along with all the edges into them, whose sources are traced as well.
+        return AttackGraph({node for node in nodes if node not in self.exploits}, {node for node in nodes if node in self.exploits},
+                           {(src, dst) for dst in nodes for src in self.dst_to_src.get(dst, ())})
 
     def get_trace_tree(self, goals):
+        return self.subgraph(self.trace((goal, 1) for goal in goals))
 
-        traced_conditions = set()
-        traced_exploits = set()
-        traced_edges = set()
+    def get_goal_traces(self, goals):
+        # the trace tree of all the goals and, for every node, the bits of the goals it contributes to.
+        contributions = self.trace((goal, 1 << i) for i, goal in enumerate(goals))
+        return self.subgraph(contributions), contributions
 
-        def _trace_subgoals(goals):
-            if goals:
-                subgoals = set()
-                traced_conditions.update(goals)
-                for goal in goals:
-                    for exploit in self.dst_to_src[goal]:
-                        traced_edges.add((exploit, goal))
-                        traced_exploits.add(exploit)
-                        for condition in self.dst_to_src[exploit]:
-                            traced_edges.add((condition, exploit))
-                            subgoals.add(condition)
-                _trace_subgoals(subgoals - traced_conditions)
+    def get_goal_slice(self, contributions, *indices):
+        mask = sum(1 << i for i in set(indices))
+        return self.subgraph({node for node, bits in contributions.items() if bits & mask})
 
-        _trace_subgoals(goals)
+    def sources(self, node):
+        return self.dst_to_src.get(node, ())
 
-        return AttackGraph(traced_conditions, traced_exploits, traced_edges)
+    def get_derivable(self, removed=()):
+        # the conditions still derived without the removed initial conditions, by forward chaining.
+        removed = set(removed)
+        derivable = {c for c in self.initial_conditions if c not in removed}
+        missing = {exploit: len(self.dst_to_src.get(exploit, ())) for exploit in self.exploits}
+        stack = [*derivable, *(exploit for exploit, count in missing.items() if not count)]
+        while stack:
+            for dst in self.src_to_dst.get(stack.pop(), ()):
+                if dst in missing:
+                    missing[dst] -= 1
+                    if not missing[dst]:
+                        stack.append(dst)
+                elif dst not in derivable:
+                    derivable.add(dst)
+                    stack.append(dst)
+        return derivable
 
-    def get_formula(self, goals):
-        # 経路表現式への変換(DAG化と同時に行う)
-        assert 1 <= len(goals)
 
-        uncontrollable_conditions = {c for c in self.initial_conditions if c[0] not in config.control_targets}
-        uncontrollable_conditions.add(('noProtection', 'the_internet'))
+class Formula:
+    # path expressions hash-consed into a DAG, each under an integer ID.
+
+    def __init__(self):
+        self.expressions = [] # (kind, condition or operand IDs) by the IDs.
+        self.ids = {}
+
+    def make(self, kind, operands):
+        if (formula_id := self.ids.get((kind, operands))) is None:
+            formula_id = self.ids[kind, operands] = len(self.expressions)
+            self.expressions.append((kind, operands))
+        return formula_id
+
+    def combine(self, node, is_exploit, operands):
+        # the expression of a node from those of its sources, simplified like the nested lists and tuples of get_formula().
+        # an empty disjunction is false, and makes a conjunction false or is left out of a disjunction.
+        operands = list(dict.fromkeys(operands))
+        false = self.ids.get(('or', ()))
+        if is_exploit:
+            if false in operands:
+                return false
+            operands = [operand for operand in operands if self.expressions[operand] != ('and', ())]
+            return operands[0] if len(operands) == 1 else self.make('and', tuple(operands))
+        if not operands:
+            return self.make('condition', node)
+        operands = [operand for operand in operands if operand != false]
+        return operands[0] if len(operands) == 1 else self.make('or', tuple(operands))
+
+    def reachable(self, root):
+        # the IDs of the expressions under the root, operands first as they are made before.
+        seen = {root}
+        stack = [root]
+        while stack:
+            kind, operands = self.expressions[stack.pop()]
+            if kind != 'condition':
+                for operand in operands:
+                    if operand not in seen:
+                        seen.add(operand)
+                        stack.append(operand)
+        return sorted(seen)
+
+    def expand(self, root):
+        # a condition as itself, a conjunction as a tuple and a disjunction as a list, sharing the expansions of shared subexpressions.
+        expanded = {}
+        for formula_id in self.reachable(root):
+            kind, operands = self.expressions[formula_id]
+            expanded[formula_id] = operands if kind == 'condition' else \
+                (tuple if kind == 'and' else list)(expanded[operand] for operand in operands)
+        return expanded[root]
+
+    def to_definitions(self, root):
+        # the DAG as one definition per subexpression, the root being defined last.
+        definitions = []
+        for formula_id in self.reachable(root):
+            kind, operands = self.expressions[formula_id]
+            definition = fact_to_label(operands) if kind == 'condition' else \
+                f" {'&' if kind == 'and' else '|'} ".join(f"f{operand}" for operand in operands) or 'true'
+            definitions.append(f"f{formula_id} = {definition}")
+        return definitions
+
 
-        dst_to_src = self.dst_to_src.copy()
-        backgrounds = defaultdict(set)
-
-        def _expand_condition(condition, exploit):
-            backgrounds[condition] |= {condition} | backgrounds[exploit]
-            expanded = []
-            for src in dst_to_src[condition]:
-                if src not in backgrounds[condition]:
-                    expanded_item = _expand_exploit(src, condition)
-                    if expanded_item not in expanded:
-                        expanded.append(expanded_item)
-            if not expanded:
-                return condition
-            elif len(expanded) == 1:
-                return expanded[0]
+def strongly_connected(starts, successors):
+    # numbers the strongly connected components of the nodes reachable from the starts (iterative Tarjan).
+    index = {}
+    lowlink = {}
+    components = {}
+    stack = []
+    for start in starts:
+        if start in index:
+            continue
+        index[start] = lowlink[start] = len(index)
+        stack.append(start)
+        frames = [(start, iter(successors(start)))]
+        while frames:
+            node, nexts = frames[-1]
+            for succ in nexts:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    frames.append((succ, iter(successors(succ))))
+                    break
+                if succ not in components:
+                    lowlink[node] = min(lowlink[node], index[succ])
             else:
-                return expanded
-
-        def _expand_exploit(exploit, condition):
-            backgrounds[exploit] |= {exploit} | backgrounds[condition]
-            expanded = []
-            for src in dst_to_src[exploit]:
-                if src not in backgrounds[exploit] and src not in uncontrollable_conditions:
-                    expanded_item = _expand_condition(src, exploit)
-                    if expanded_item not in expanded:
-                        expanded.append(expanded_item)
-            expanded = tuple(c for c in expanded if c)
-            return expanded[0] if len(expanded) == 1 else expanded
-
-        if len(goals) == 1:
-            return _expand_condition(list(goals)[0], None)
+                frames.pop()
+                if frames:
+                    lowlink[frames[-1][0]] = min(lowlink[frames[-1][0]], lowlink[node])
+                if lowlink[node] == index[node]:
+                    while (member := stack.pop()) != node:
+                        components[member] = index[node]
+                    components[node] = index[node]
+    return components
+
+
+def build_formula(goals, predecessors, uncontrollable_conditions, founded=False, any_goal=False):
+    # returns the path expression of the goals as a Formula along with its root.
+    goals = list(goals)
+    joined = len(goals) > 1
+    root = object() if joined else goals[0]
+    sources = lambda node: goals if joined and node is root else predecessors(node)
+    components = strongly_connected([root], sources)
+
+    formula = Formula()
+    memo = {}
+    background = frozenset([root])
+    frames = [(root, joined and not any_goal, background, iter(sources(root)), [])]
+    while frames:
+        node, is_exploit, background, nexts, operands = frames[-1]
+        for src in nexts:
+            if founded and src in background:
+                operands.append(formula.make('or', ()))
+                continue
+            if src in background or is_exploit and src in uncontrollable_conditions:
+                continue
+            # the path leaves the component of a node for good, so only the nodes of the same component matter.
+            src_background = background | {src} if components[src] == components[node] else frozenset([src])
+            if (key := (src, src_background)) in memo:
+                operands.append(memo[key])
+            else:
+                # the goals are conditions, whichever dummy node joins them.
+                frames.append((src, not is_exploit and not (joined and node is root), src_background, iter(sources(src)), []))
+                break
         else:
-            dummy_exploit = 'ex'
-            dst_to_src[dummy_exploit] = set(goals)
-            return _expand_exploit(dummy_exploit, None)
+            frames.pop()
+            memo[node, background] = expression = formula.combine(node, is_exploit, operands)
+            if frames:
+                frames[-1][4].append(expression)
 
-    def to_dot(self) -> str:
-        app_dir = os.path.dirname(__file__)
-        with open(app_dir + '/graph_template.dot', 'r') as fp:
-            template = fp.read()
+    return formula, expression
 
-        def node_to_label(node):
-            return node if isinstance(node, str) else fact_to_label(node)
 
-        sep = '_'
-        node_defs = [f'"{node_to_label(condition)}" [shape=rect, style="rounded"];' for condition in self.conditions] + [f'"{exploit}" [shape=box];' for exploit in self.exploits]
-        edge_defs = [f'"{node_to_label(src)}" -> "{node_to_label(dst)}";' for src, dst in self.edges]
-        return template.replace('%Nodes%', '\n  '.join(node_defs)).replace('%Edges%', '\n  '.join(edge_defs))
+def csr(size, keys, values):
+    # groups the values by their keys in 0..size-1, as the offsets of each group and the values back to back.
+    offsets = array('Q', bytes(8 * (size + 1)))
+    for key in keys:
+        offsets[key + 1] += 1
+    for key in range(size):
+        offsets[key + 1] += offsets[key]
+    grouped = array('I', bytes(4 * len(keys)))
+    positions = offsets[:-1]
+    for key, value in zip(keys, values):
+        grouped[positions[key]] = value
+        positions[key] += 1
+    return offsets, grouped
+
+
+class CompactAttackGraph(GraphQueries):
+    # an AttackGraph with integer node IDs and CSR edges.
+
+    @classmethod
+    def from_instances(cls, instances):
+        nodes = []
+        node_ids = {}
+        sources = array('I')
+        targets = array('I')
+
+        def node_id(node):
+            if (node_id := node_ids.get(node)) is None:
+                node_id = node_ids[node] = len(nodes)
+                nodes.append(node)
+            return node_id
+
+        exploits = {}
+        for instance in instances:
+            head, *body = instance
+            # the exploits are identified and labeled like in AttackGraph.from_instances(), and repeated ones add no edges.
+            if instance in exploits:
+                continue
+            exploit = exploits[instance] = node_id(f"e{len(exploits) + 1}")
+            for fact in dict.fromkeys(body):
+                sources.append(node_id(fact))
+                targets.append(exploit)
+            sources.append(exploit)
+            targets.append(node_id(head))
+
+        exploit_ids = set(exploits.values())
+        return cls(nodes, bytes(node in exploit_ids for node in range(len(nodes))), sources, targets)
+
+    @classmethod
+    def from_graph(cls, graph):
+        nodes = [*graph.conditions, *graph.exploits]
+        node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+        return cls(nodes, bytes(len(graph.conditions)) + bytes([1]) * len(graph.exploits),
+                   array('I', (node_ids[src] for src, _ in graph.edges)), array('I', (node_ids[dst] for _, dst in graph.edges)))
+
+    def __init__(self, nodes, kinds, sources, targets):
+        self.nodes = nodes # the conditions and the exploits by their IDs.
+        self.node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+        self.kinds = kinds # 1 for the exploits and 0 for the conditions, by the node IDs.
+        self.forward_offsets, self.forward = csr(len(nodes), sources, targets)
+        self.backward_offsets, self.backward = csr(len(nodes), targets, sources)
+
+        offsets = self.backward_offsets
+        self.conditions_by_pred = defaultdict(list) # the IDs of the conditions by their predicates.
+        for node_id, node in enumerate(nodes):
+            if not kinds[node_id]:
+                self.conditions_by_pred[node[0]].append(node_id)
+        self._initial_conditions = frozenset(node for node_id, node in enumerate(nodes) if not kinds[node_id] and offsets[node_id] == offsets[node_id + 1])
+
+    def successors(self, node_id):
+        return self.forward[self.forward_offsets[node_id]:self.forward_offsets[node_id + 1]]
+
+    def predecessors(self, node_id):
+        return self.backward[self.backward_offsets[node_id]:self.backward_offsets[node_id + 1]]
+
+    def sources(self, node):
+        return [self.nodes[src] for src in self.predecessors(self.node_ids[node])]
+
+    @property
+    def conditions(self):
+        return {node for node, kind in zip(self.nodes, self.kinds) if not kind}
+
+    @property
+    def exploits(self):
+        return {node for node, kind in zip(self.nodes, self.kinds) if kind}
+
+    @property
+    def edges(self):
+        return {(self.nodes[src], self.nodes[dst]) for dst in range(len(self.nodes)) for src in self.predecessors(dst)}
+
+    @property
+    def initial_conditions(self):
+        return self._initial_conditions
+
+    def filter_facts_with_pred(self, *preds):
+        return {self.nodes[node_id] for pred in preds for node_id in self.conditions_by_pred.get(pred, ())}
+
+    def trace(self, seeds):
+        # like AttackGraph.trace(), over the node IDs; the seeds not in the graph are returned apart, with their bits.
+        contributions = [0] * len(self.nodes)
+        absent = {}
+        stack = []
+        for goal, bits in seeds:
+            if (node_id := self.node_ids.get(goal)) is None:
+                absent[goal] = absent.get(goal, 0) | bits
+            else:
+                contributions[node_id] |= bits
+                stack.append(node_id)
+        while stack:
+            bits = contributions[node_id := stack.pop()]
+            for src in self.predecessors(node_id):
+                if bits & ~contributions[src]:
+                    contributions[src] |= bits
+                    stack.append(src)
+        return contributions, absent
+
+    def subgraph(self, traced, absent=()):
+        # the nodes of the given IDs along with all the edges into them, renumbered in the order of the IDs, followed by
+        # the absent conditions on their own, as AttackGraph keeps the goals not in it.
+        traced = sorted(traced)
+        absent = list(absent)
+        renumbered = {node_id: new_id for new_id, node_id in enumerate(traced)}
+        sources = array('I', (renumbered[src] for dst in traced for src in self.predecessors(dst)))
+        targets = array('I', (renumbered[dst] for dst in traced for _ in self.predecessors(dst)))
+        return CompactAttackGraph([*(self.nodes[node_id] for node_id in traced), *absent],
+                                  bytes(self.kinds[node_id] for node_id in traced) + bytes(len(absent)), sources, targets)
+
+    def get_trace_tree(self, goals):
+        contributions, absent = self.trace((goal, 1) for goal in goals)
+        return self.subgraph((node_id for node_id, bits in enumerate(contributions) if bits), absent)
+
+    def get_goal_traces(self, goals):
+        contributions, absent = self.trace((goal, 1 << i) for i, goal in enumerate(goals))
+        return (self.subgraph((node_id for node_id, bits in enumerate(contributions) if bits), absent),
+                {**{self.nodes[node_id]: bits for node_id, bits in enumerate(contributions) if bits}, **absent})
+
+    def get_goal_slice(self, contributions, *indices):
+        mask = sum(1 << i for i in set(indices))
+        sliced = [node for node, bits in contributions.items() if bits & mask]
+        return self.subgraph((self.node_ids[node] for node in sliced if node in self.node_ids),
+                             (node for node in sliced if node not in self.node_ids))
+
+    def get_derivable(self, removed=()):
+        # like AttackGraph.get_derivable(), over the node IDs.
+        removed = {self.node_ids[condition] for condition in removed if condition in self.node_ids}
+        offsets = self.backward_offsets
+        missing = array('Q', (offsets[node_id + 1] - offsets[node_id] for node_id in range(len(self.nodes))))
+        stack = [node_id for node_id in range(len(self.nodes)) if not missing[node_id] and (self.kinds[node_id] or node_id not in removed)]
+        derivable = bytearray(len(self.nodes))
+        for node_id in stack:
+            derivable[node_id] = 1
+        while stack:
+            for dst in self.successors(stack.pop()):
+                if self.kinds[dst]:
+                    missing[dst] -= 1
+                    if not missing[dst]:
+                        stack.append(dst)
+                elif not derivable[dst]:
+                    derivable[dst] = 1
+                    stack.append(dst)
+        return {node for node_id, node in enumerate(self.nodes) if derivable[node_id] and not self.kinds[node_id]}
+
+
+def read_instances(buffer):
+    magic, version, instance_words, fact_count, fact_words, string_count, string_bytes = HEADER.unpack_from(buffer)
+    if version != VERSION:
+        raise ValueError(f"unsupported version of the attack graph format: {version}")
+
+    view = memoryview(buffer)
+    offset = HEADER.size
+
+    def words(count):
+        nonlocal offset
+        section = view[offset:offset + 4 * count]
+        offset += 4 * count
+        if sys.byteorder == 'little':
+            return section.cast('I')
+        swapped = array('I', section)
+        swapped.byteswap()
+        return swapped
+
+    instance_ids = words(instance_words)
+    fact_offsets, fact_ids = words(fact_count + 1), words(fact_words)
+    string_offsets = words(string_count + 1)
+    strings = view[offset:offset + string_bytes]
+
+    names = [str(strings[string_offsets[i]:string_offsets[i + 1]], 'utf-8') for i in range(string_count)]
+    facts = [tuple(names[string_id] for string_id in fact_ids[fact_offsets[i]:fact_offsets[i + 1]]) for i in range(fact_count)]
+    instances = []
+    i = 0
+    while i < instance_words:
+        instances.append(tuple(facts[fact_id] for fact_id in instance_ids[i + 1:i + 1 + instance_ids[i]]))
+        i += 1 + instance_ids[i]
+    return instances
 
 
-def load_attack_graph(filename):
-    with open(filename, encoding='utf-8') as datafile:
-        return AttackGraph.from_instances(eval(datafile.read()))
+def load_attack_graph(filename, compact=False):
+    graph_class = CompactAttackGraph if compact else AttackGraph
+    with open(filename, 'rb') as datafile:
+        if os.path.splitext(filename)[1] == '.py':
+            # the Python list literal written by "datalog.py --python" for debugging, read as a literal only.
+            return graph_class.from_instances(ast.literal_eval(datafile.read().decode('utf-8')))
+        if datafile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not an attack graph written by datalog.py, or its writing did not finish")
+        with mmap.mmap(datafile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return graph_class.from_instances(read_instances(mapped))
 
 
 def fact_to_label(fact):